@@ -1,4 +1,5 @@
 import { NextResponse } from "next/server";
+import { serverTiming } from "@/lib/serverTiming";
 
 const CLINICAL_API_BASE = process.env.CLINICAL_API_BASE || "http://localhost:8000";
 
@@ -6,6 +7,7 @@ export async function POST(req: Request) {
   try {
     const body = await req.json();
 
+    const started = performance.now();
     const res = await fetch(`${CLINICAL_API_BASE}/predict/clinical_risk`, {
       method: "POST",
       headers: { "Content-Type": "application/json" },
@@ -16,12 +18,12 @@ export async function POST(req: Request) {
       const text = await res.text();
       return NextResponse.json(
         { error: "Upstream clinical API failed", detail: text },
-        { status: res.status }
+        { status: res.status, headers: serverTiming(res, started) }
       );
     }
 
     const data = await res.json();
-    return NextResponse.json(data);
+    return NextResponse.json(data, { headers: serverTiming(res, started) });
   } catch (err: any) {
     console.error("Clinical proxy error:", err);
     return NextResponse.json(
@@ -9,6 +9,7 @@
  */
 
 import { NextRequest, NextResponse } from "next/server";
+import { serverTiming } from "@/lib/serverTiming";
 
 const ML_API_URL = process.env.ML_API_URL || "http://localhost:8000";
 
@@ -80,6 +81,7 @@ export async function POST(req: NextRequest) {
     }
 
     // Call FastAPI service
+    const started = performance.now();
     const response = await fetch(`${ML_API_URL}/predict/${type}`, {
       method: "POST",
       headers: {
@@ -92,7 +94,7 @@ export async function POST(req: NextRequest) {
       const error = await response.json().catch(() => ({ detail: "Unknown error" }));
       return NextResponse.json(
         { error: error.detail || "ML service error" },
-        { status: response.status }
+        { status: response.status, headers: serverTiming(response, started) }
       );
     }
 
@@ -104,7 +106,7 @@ export async function POST(req: NextRequest) {
       disclaimer:
         "SubHealthAI predictions are non-diagnostic research metrics. They do not confirm or rule out any disease. Please consult a physician for medical interpretation.",
       non_diagnostic: true,
-    });
+    }, { headers: serverTiming(response, started) });
   } catch (error) {
     console.error("Error calling ML API:", error);
     return NextResponse.json(
@@ -0,0 +1,6 @@
+// Pass the inference service's Server-Timing phases through and add the proxy hop.
+export function serverTiming(upstream: Response, started: number) {
+  const proxy = `proxy;dur=${(performance.now() - started).toFixed(3)}`;
+  const inner = upstream.headers.get("server-timing");
+  return { "Server-Timing": inner ? `${inner}, ${proxy}` : proxy };
+}
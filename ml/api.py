@@ -1,13 +1,49 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import joblib
-import pandas as pd
-import uvicorn
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from typing import List, Literal, Optional, Union
+from contextlib import asynccontextmanager
+import numpy as np
+import asyncio
+import json
 import os
+import sys
+import tempfile
+import time
+
+try:
+    from .tree_engine import compile_ensemble, probe_rows, parity_error, PARITY_ATOL
+    from .batcher import MicroBatcher
+    from .inference_pool import InferencePool, PoolSaturated
+    from .model_registry import ModelRegistry, ModelSnapshot
+    from .prefork import serve_prefork
+    from .telemetry import Telemetry, TelemetryMiddleware, phase, traced
+    from .cohort_io import detect_format, iter_records, iter_chunks
+    from .shadow import ShadowScorer, configure_log, parse_candidates
+    from .explain import build_explainer, attributions
+except ImportError:
+    # Running as `uvicorn api:app` from inside ml/
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from ml.tree_engine import compile_ensemble, probe_rows, parity_error, PARITY_ATOL
+    from ml.batcher import MicroBatcher
+    from ml.inference_pool import InferencePool, PoolSaturated
+    from ml.model_registry import ModelRegistry, ModelSnapshot
+    from ml.prefork import serve_prefork
+    from ml.telemetry import Telemetry, TelemetryMiddleware, phase, traced
+    from ml.cohort_io import detect_format, iter_records, iter_chunks
+    from ml.shadow import ShadowScorer, configure_log, parse_candidates
+    from ml.explain import build_explainer, attributions
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Watcher threads are per process, so start them once the server is running
+    REGISTRY.start_watching()
+    yield
 
 # DEFINING THE APP
-app = FastAPI(title="SubHealthAI Clinical Backend")
+app = FastAPI(title="SubHealthAI Clinical Backend", lifespan=lifespan)
 
 # ---------------------------------------------------------
 # 0. CORS CONFIGURATION (CRITICAL FOR REACT)
@@ -20,41 +56,257 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
+# Request counts, in-flight gauges and per-phase latency histograms for /metrics.
+# Unknown paths are folded into one label so scanners can't blow up the table.
+TELEMETRY = Telemetry()
+STARTED_AT = time.time()
+_ROUTE_PATHS = set()
+
+def route_label(path: str) -> str:
+    if not _ROUTE_PATHS:
+        _ROUTE_PATHS.update(getattr(r, "path", None) for r in app.routes)
+    return path if path in _ROUTE_PATHS else "other"
+
+# ML_SERVER_TIMING=1 adds a Server-Timing header (parse, features, diabetes, cardio,
+# drivers, serialize) to prediction responses; ML_TIMING_LOG=1 logs the same as JSON.
+app.add_middleware(
+    TelemetryMiddleware,
+    telemetry=TELEMETRY,
+    label=route_label,
+    server_timing=os.getenv("ML_SERVER_TIMING", "0") == "1",
+    log_timing=os.getenv("ML_TIMING_LOG", "0") == "1",
+)
+
 # ---------------------------------------------------------
 # 1. LOAD MODELS
 # ---------------------------------------------------------
-MODELS = {}
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.getenv("ML_MODELS_DIR", os.path.join(BASE_DIR, "models"))
+
+# Feature order the clinical models were trained on (see train_model.py)
+DIABETES_COLUMNS = ['Pregnancies', 'Glucose', 'BloodPressure', 'SkinThickness', 'Insulin', 'BMI', 'DiabetesPedigreeFunction', 'Age']
+CARDIO_COLUMNS = ['age', 'sex', 'cp', 'trestbps', 'chol', 'fbs', 'restecg', 'thalach', 'exang', 'oldpeak', 'slope', 'ca', 'thal']
+
+# /predict/clinical_risk: model column -> ClinicalInput field, plus fixed values
+CLINICAL_DIABETES_FIELDS = {
+    'Pregnancies': 'pregnancies', 'Glucose': 'glucose', 'BloodPressure': 'systolic_bp',
+    'SkinThickness': 'skin_thickness', 'Insulin': 'insulin', 'BMI': 'bmi', 'Age': 'age'
+}
+CLINICAL_DIABETES_DEFAULTS = {'DiabetesPedigreeFunction': 0.5}
+CLINICAL_CARDIO_FIELDS = {'age': 'age', 'trestbps': 'systolic_bp', 'chol': 'cholesterol'}
+CLINICAL_CARDIO_DEFAULTS = {
+    'sex': 1, 'cp': 4, 'fbs': 0, 'restecg': 1, 'thalach': 150,
+    'exang': 0, 'oldpeak': 1.0, 'slope': 2, 'ca': 0, 'thal': 3
+}
+
+# /predict/diabetes: missing inputs filled with typical median values from Pima dataset
+LEGACY_DIABETES_FIELDS = {'Glucose': 'glucose', 'BloodPressure': 'bp', 'BMI': 'bmi', 'Age': 'age'}
+LEGACY_DIABETES_DEFAULTS = {
+    'Pregnancies': 3.0,  # Median from Pima dataset
+    'SkinThickness': 29.0,  # Median from Pima dataset
+    'Insulin': 125.0,  # Median from Pima dataset
+    'DiabetesPedigreeFunction': 0.3725  # Median from Pima dataset
+}
+
+# /predict/cardio: missing inputs filled with typical values from Cleveland dataset
+LEGACY_CARDIO_FIELDS = {'age': 'age', 'trestbps': 'systolic_bp', 'chol': 'cholesterol', 'thalach': 'resting_hr'}
+LEGACY_CARDIO_DEFAULTS = {
+    'sex': 1.0,  # 1 = male (typical default)
+    'cp': 1.0,  # Typical chest pain type (1 = typical angina)
+    'fbs': 0.0,  # Fasting blood sugar < 120 mg/dl (0 = false)
+    'restecg': 0.0,  # Resting ECG normal (0 = normal)
+    'exang': 0.0,  # Exercise induced angina (0 = no)
+    'oldpeak': 1.0,  # ST depression induced by exercise (median)
+    'slope': 1.0,  # Slope of peak exercise ST segment (1 = upsloping)
+    'ca': 0.0,  # Number of major vessels colored by flourosopy (0 = none)
+    'thal': 2.0  # Thalassemia (2 = normal)
+}
+
+class FeatureTemplate:
+    """
+    Preallocated feature row for one model and one request schema.
+
+    Column positions are resolved once against the loaded model, so a request
+    only copies the template and writes its own fields into it.
+    """
+    def __init__(self, columns: List[str], fields: dict, defaults: dict):
+        missing = set(columns) - set(fields) - set(defaults)
+        if missing:
+            raise ValueError(f"No value for model features: {sorted(missing)}")
+        self.columns = list(columns)
+        self.row = np.zeros(len(columns), dtype=np.float64)
+        for col, value in defaults.items():
+            self.row[self.columns.index(col)] = value
+        self.slots = [(self.columns.index(col), field) for col, field in fields.items()]
+
+    def build(self, records) -> np.ndarray:
+        """Return an (n_records, n_features) matrix in the model's column order."""
+        if len(records) == 1:
+            x = self.row.copy()
+            for idx, field in self.slots:
+                x[idx] = getattr(records[0], field)
+            return x[None, :]
+        X = np.tile(self.row, (len(records), 1))
+        for idx, field in self.slots:
+            X[:, idx] = [getattr(r, field) for r in records]
+        return X
+
+    def fields(self) -> dict:
+        """Model column -> request field, for the columns a request fills in."""
+        return {self.columns[idx]: field for idx, field in self.slots}
+
+    def build_grid(self, base, grid: dict) -> np.ndarray:
+        """Tile `base`'s row once per grid point and overwrite the swept fields column-wise."""
+        n = len(next(iter(grid.values())))
+        X = np.tile(self.build([base])[0], (n, 1))
+        for idx, field in self.slots:
+            if field in grid:
+                X[:, idx] = grid[field]
+        return X
+
+def model_columns(model, expected: List[str]) -> List[str]:
+    """
+    Check a loaded model's feature order once and return it.
+
+    Models fitted on DataFrames carry feature_names_in_; we keep the order but
+    drop the attribute so plain NumPy rows skip sklearn's per-call name check.
+    """
+    names = getattr(model, 'feature_names_in_', None)
+    if names is None:
+        if getattr(model, 'n_features_in_', len(expected)) != len(expected):
+            raise ValueError(f"Model expects {model.n_features_in_} features, not {len(expected)}")
+        return list(expected)
+    names = [str(n) for n in names]
+    if sorted(names) != sorted(expected):
+        raise ValueError(f"Model features {names} do not match {expected}")
+    del model.feature_names_in_
+    return names
+
+def build_templates(snap: ModelSnapshot):
+    """Resolve feature templates for whichever models loaded; drop a model whose features don't line up."""
+    specs = {
+        'diabetes': (DIABETES_COLUMNS, {
+            'clinical_diabetes': (CLINICAL_DIABETES_FIELDS, CLINICAL_DIABETES_DEFAULTS),
+            'legacy_diabetes': (LEGACY_DIABETES_FIELDS, LEGACY_DIABETES_DEFAULTS),
+        }),
+        'cardio': (CARDIO_COLUMNS, {
+            'clinical_cardio': (CLINICAL_CARDIO_FIELDS, CLINICAL_CARDIO_DEFAULTS),
+            'legacy_cardio': (LEGACY_CARDIO_FIELDS, LEGACY_CARDIO_DEFAULTS),
+        }),
+    }
+    for name, (expected, templates) in specs.items():
+        if name not in snap.models:
+            continue
+        try:
+            columns = model_columns(snap.models[name], expected)
+            for key, (fields, defaults) in templates.items():
+                snap.templates[key] = FeatureTemplate(columns, fields, defaults)
+        except Exception as e:
+            print(f"⚠️ Warning: {name} model rejected. Error: {e}")
+            snap.models.pop(name, None)
+            snap.versions.pop(name, None)
+
+def compile_engines(snap: ModelSnapshot):
+    """Compile each loaded model to flat node arrays; keep it only if it matches sklearn."""
+    for name, model in snap.models.items():
+        try:
+            engine = compile_ensemble(model)
+            if engine is None:
+                print(f"ℹ️ {name}: {type(model).__name__} has no compiled engine, using sklearn")
+                continue
+            err = parity_error(model, engine, probe_rows(engine))
+            if err > PARITY_ATOL:
+                print(f"⚠️ Warning: {name} compiled engine off by {err:.2e}, using sklearn")
+                continue
+            snap.engines[name] = engine
+        except Exception as e:
+            print(f"⚠️ Warning: {name} engine compile failed, using sklearn. Error: {e}")
+
+# Which template's row probes each explainer (see explain.build_explainer)
+EXPLAIN_TEMPLATES = {'diabetes': 'clinical_diabetes', 'cardio': 'clinical_cardio'}
+
+def build_explainers(snap: ModelSnapshot):
+    """Build each model's TreeSHAP explainer once, so /explain never pays for it per request."""
+    for name, key in EXPLAIN_TEMPLATES.items():
+        if name not in snap.models or key not in snap.templates:
+            continue
+        try:
+            explainer = build_explainer(snap.models[name], snap.templates[key].row[None, :])
+            if explainer is None:
+                print("ℹ️ shap not installed; /explain/clinical_risk disabled")
+                return
+            snap.explainers[name] = explainer
+        except Exception as e:
+            print(f"⚠️ Warning: {name} explainer failed, no attributions for it. Error: {e}")
+
+def prepare_shadow_snapshot(snap: ModelSnapshot):
+    # Shadow candidates are only scored, never explained
+    build_templates(snap)
+    compile_engines(snap)
+
+def prepare_snapshot(snap: ModelSnapshot):
+    prepare_shadow_snapshot(snap)
+    if os.getenv("ML_EXPLAINERS", "1") == "1":
+        build_explainers(snap)
+
+# The compiled engine gathers across the whole (rows x trees) matrix once per
+# depth level, so it only beats sklearn on small inputs. Measured on the stand-in
+# models: GBM crosses over between 128 and 256 rows, the forest well after that.
+ENGINE_MAX_ROWS = int(os.getenv("ML_ENGINE_MAX_ROWS", "128"))
+
+def predict_positive(snap: ModelSnapshot, name: str, X: np.ndarray) -> np.ndarray:
+    """Positive-class probability per row, from the compiled engine for small finite inputs."""
+    engine = snap.engines.get(name)
+    with phase(name):
+        if engine is not None and len(X) <= ENGINE_MAX_ROWS and np.isfinite(X).all():
+            return engine.predict_proba(X)[:, 1]
+        return snap.models[name].predict_proba(X)[:, 1]
+
+# Newest <name>_model_vN.pkl wins; the registry polls MODELS_DIR and swaps in
+# retrained models without a restart (ML_MODEL_POLL_S=0 disables the watcher).
+# Files named in ML_SHADOW_MODELS are held back as shadow candidates instead.
+SHADOW_MODELS = parse_candidates(os.getenv("ML_SHADOW_MODELS", ""))
+REGISTRY = ModelRegistry(
+    MODELS_DIR,
+    prepare=prepare_snapshot,
+    poll_s=float(os.getenv("ML_MODEL_POLL_S", "5")),
+    shadow=SHADOW_MODELS,
+    prepare_shadow=prepare_shadow_snapshot,
+)
+
+# Shadow mode: a sample (ML_SHADOW_SAMPLE_RATE) of scoring calls is replayed
+# against the candidates on a background thread after the primary result is in,
+# logging both probabilities and the latency delta as JSON (ML_SHADOW_LOG file,
+# else stderr). Responses never wait on it; backlog beyond the queue is dropped.
+SHADOW = None
+if SHADOW_MODELS:
+    configure_log(os.getenv("ML_SHADOW_LOG") or None)
+    SHADOW = ShadowScorer(
+        predict_positive,
+        sample_rate=float(os.getenv("ML_SHADOW_SAMPLE_RATE", "0.1")),
+        queue_size=int(os.getenv("ML_SHADOW_QUEUE", "256")),
+    )
+
+def score_with_shadow(snap: ModelSnapshot, jobs: dict) -> dict:
+    """
+    Run predict_positive per {model name: (template key, records, X)} and
+    offer the calls to the shadow scorer. Returns {model name: probabilities}.
+    """
+    probs, offered = {}, {}
+    for name, (template_key, records, X) in jobs.items():
+        t0 = time.perf_counter()
+        probs[name] = predict_positive(snap, name, X)
+        offered[name] = (template_key, records, probs[name], time.perf_counter() - t0)
+    if SHADOW is not None:
+        SHADOW.offer(snap, offered)
+    return probs
 
 def load_models():
     try:
-        # Get the directory where this file is located
-        BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-        MODELS_DIR = os.path.join(BASE_DIR, "models")
-        
-        # Ensure these path names match exactly where you saved them
-        diabetes_path = os.path.join(MODELS_DIR, 'diabetes_model_v1.pkl')
-        cardio_path = os.path.join(MODELS_DIR, 'cardio_model_v1.pkl')
-        
-        # Try versioned names first, fall back to default names
-        if os.path.exists(diabetes_path):
-            MODELS['diabetes'] = joblib.load(diabetes_path)
-        else:
-            default_diabetes = os.path.join(MODELS_DIR, 'diabetes_model.pkl')
-            if os.path.exists(default_diabetes):
-                MODELS['diabetes'] = joblib.load(default_diabetes)
-            else:
-                raise FileNotFoundError(f"Diabetes model not found at {diabetes_path} or {default_diabetes}")
-        
-        if os.path.exists(cardio_path):
-            MODELS['cardio'] = joblib.load(cardio_path)
-        else:
-            default_cardio = os.path.join(MODELS_DIR, 'cardio_model.pkl')
-            if os.path.exists(default_cardio):
-                MODELS['cardio'] = joblib.load(default_cardio)
-            else:
-                raise FileNotFoundError(f"Cardio model not found at {cardio_path} or {default_cardio}")
-        
-        print("✅ Clinical Models Loaded Successfully")
+        snap = REGISTRY.load()
+        if not snap.has('diabetes', 'cardio'):
+            raise FileNotFoundError(f"Expected diabetes and cardio models in {MODELS_DIR}, found {sorted(snap.models)}")
+        print(f"✅ Clinical Models Loaded Successfully: {snap.versions}")
     except Exception as e:
         print(f"⚠️ Warning: Models not found. Error: {e}")
         print("   (Ensure .pkl files are in 'ml/models/' folder)")
@@ -64,7 +316,14 @@ load_models()
 # ---------------------------------------------------------
 # 2. DATA STRUCTURES
 # ---------------------------------------------------------
+# NaN / inf would pass float validation and then fail the model call for every
+# row scored with it (a whole /batch, /stream chunk or micro-batch); reject them
+# per row instead.
+FINITE_ONLY = ConfigDict(allow_inf_nan=False)
+
 class ClinicalInput(BaseModel):
+    model_config = FINITE_ONLY
+
     # Clinical Data (Brain 1)
     glucose: float       # mg/dL
     bmi: float          
@@ -82,17 +341,44 @@ class ClinicalInput(BaseModel):
 
 # Legacy models for backward compatibility
 class HealthData(BaseModel):
+    model_config = FINITE_ONLY
+
     glucose: float
     bmi: float
     age: int
     bp: float  # systolic BP
 
 class CardioData(BaseModel):
+    model_config = FINITE_ONLY
+
     age: int
     systolic_bp: float
     cholesterol: float
     resting_hr: float
 
+SWEEP_FEATURES = ("glucose", "bmi", "systolic_bp", "cholesterol")
+
+class SweepAxis(BaseModel):
+    model_config = FINITE_ONLY
+
+    feature: Literal["glucose", "bmi", "systolic_bp", "cholesterol"]
+    # Either explicit values, or an evenly spaced start..stop range with `steps` points
+    values: Optional[List[float]] = None
+    start: Optional[float] = None
+    stop: Optional[float] = None
+    steps: int = Field(10, ge=2, le=1000)
+
+    def points(self) -> np.ndarray:
+        if self.values:
+            return np.asarray(self.values, dtype=np.float64)
+        if self.start is None or self.stop is None:
+            raise ValueError(f"{self.feature}: give either values or start and stop")
+        return np.linspace(self.start, self.stop, self.steps)
+
+class WhatIfRequest(BaseModel):
+    base: ClinicalInput
+    vary: List[SweepAxis] = Field(..., min_length=1, max_length=len(SWEEP_FEATURES))
+
 def map_risk_level(prob: float) -> str:
     """Map probability to risk level"""
     if prob > 0.7:
@@ -112,44 +398,78 @@ def health_check():
 @app.get("/health")
 def health():
     """Detailed health check"""
+    snap = REGISTRY.current()
     return {
         "status": "healthy",
-        "diabetes_model_loaded": 'diabetes' in MODELS,
-        "cardiac_model_loaded": 'cardio' in MODELS
+        "diabetes_model_loaded": 'diabetes' in snap.models,
+        "cardiac_model_loaded": 'cardio' in snap.models,
+        "model_versions": snap.versions,
+        "models_loaded_at": snap.loaded_at,
+        "compiled_engines": sorted(snap.engines),
+        "shadow_versions": snap.shadow.versions if snap.shadow is not None else {},
+        "micro_batcher": BATCHER.stats() if BATCHER is not None else None,
+        "inference_pool": POOL.stats() if POOL is not None else None
     }
 
-# This was the missing endpoint causing the 404
-@app.post("/predict/clinical_risk")
-def predict_clinical_risk(data: ClinicalInput):
-    """
-    Fuses Chronic Disease Models (RF/GBM) with Acute Signals.
-    """
-    if 'diabetes' not in MODELS or 'cardio' not in MODELS:
-        raise HTTPException(status_code=503, detail="Models not loaded on server")
-    
+@app.get("/metrics")
+def metrics():
+    """Per-endpoint counts, in-flight requests and latency histograms, split by phase (this process only)."""
+    snap = REGISTRY.current()
+    return {
+        "pid": os.getpid(),
+        "uptime_s": round(time.time() - STARTED_AT, 1),
+        "endpoints": TELEMETRY.snapshot(),
+        "models": {
+            "versions": snap.versions,
+            "loaded_at": snap.loaded_at,
+            "compiled_engines": sorted(snap.engines),
+            "reloads": REGISTRY.reloads,
+        },
+        "micro_batcher": BATCHER.stats() if BATCHER is not None else None,
+        "inference_pool": POOL.stats() if POOL is not None else None,
+        "shadow": SHADOW.stats() if SHADOW is not None else None,
+    }
+
+def score_clinical_batch(records: List[ClinicalInput], snap: ModelSnapshot = None):
+    """Score many inputs with a single evaluation per model."""
+    snap = snap or REGISTRY.current()
+    with phase("features"):
+        diab_input = snap.templates['clinical_diabetes'].build(records)
+        cardio_input = snap.templates['clinical_cardio'].build(records)
+    probs = score_with_shadow(snap, {
+        'diabetes': ('clinical_diabetes', records, diab_input),
+        'cardio': ('clinical_cardio', records, cardio_input),
+    })
+    return probs['diabetes'], probs['cardio']
+
+def score_clinical_pairs(records: List[ClinicalInput]):
+    """(diabetes, cardio) probability pair per record, for the micro-batcher."""
+    diab_probs, cardio_probs = score_clinical_batch(records)
+    return list(zip(diab_probs, cardio_probs))
+
+# Coalesce concurrent /predict/clinical_risk calls into one model call per burst.
+# Off unless ML_MICROBATCH=1; ML_BATCH_WINDOW_MS / ML_BATCH_MAX_SIZE tune it.
+BATCHER = None
+if os.getenv("ML_MICROBATCH", "0") == "1":
+    BATCHER = MicroBatcher(
+        score_clinical_pairs,
+        window_ms=float(os.getenv("ML_BATCH_WINDOW_MS", "2")),
+        max_batch=int(os.getenv("ML_BATCH_MAX_SIZE", "64")),
+    )
+
+def acute_multiplier(data: ClinicalInput) -> float:
+    """Wearable-driven scale applied to the averaged model probabilities."""
+    return 1.15 if data.avg_hrv < 30 else 1.0
+
+def clinical_response(data: ClinicalInput, diab_prob: float, cardio_prob: float) -> dict:
+    """Apply the acute (wearable) modifier and driver rules to model probabilities."""
+    diab_prob = float(diab_prob)
+    cardio_prob = float(cardio_prob)
     risk_drivers = []
-    
-    # --- A. DIABETES PREDICTION ---
-    diab_input = pd.DataFrame([[
-        data.pregnancies, data.glucose, data.systolic_bp, 
-        data.skin_thickness, data.insulin, data.bmi, 
-        0.5, data.age 
-    ]], columns=['Pregnancies', 'Glucose', 'BloodPressure', 'SkinThickness', 'Insulin', 'BMI', 'DiabetesPedigreeFunction', 'Age'])
-    
-    diab_prob = MODELS['diabetes'].predict_proba(diab_input)[0][1]
-    
-    # --- B. CARDIO PREDICTION ---
-    cardio_input = pd.DataFrame([[
-        data.age, 1, 4, data.systolic_bp, 
-        data.cholesterol, 0, 1, 150, 0, 1.0, 2, 0, 3
-    ]], columns=['age', 'sex', 'cp', 'trestbps', 'chol', 'fbs', 'restecg', 'thalach', 'exang', 'oldpeak', 'slope', 'ca', 'thal'])
-    
-    cardio_prob = MODELS['cardio'].predict_proba(cardio_input)[0][1]
-    
+
     # --- C. ACUTE MODIFIER (The "Watch" Data) ---
-    acute_stress_multiplier = 1.0
+    acute_stress_multiplier = acute_multiplier(data)
     if data.avg_hrv < 30:
-        acute_stress_multiplier += 0.15
         risk_drivers.append({"factor": "Low HRV", "impact": "+12%"})
     elif data.avg_hrv < 50:
         risk_drivers.append({"factor": "Reduced HRV", "impact": "+5%"})
@@ -193,37 +513,165 @@ def predict_clinical_risk(data: ClinicalInput):
         "status": "processed"
     }
 
-# Legacy endpoints for backward compatibility
-@app.post("/predict/diabetes")
-def predict_diabetes(data: HealthData):
-    """
-    Predict diabetes/metabolic risk based on health metrics
+# ---------------------------------------------------------
+# 4. SCORING (runs off the event loop)
+# ---------------------------------------------------------
+def score_clinical_risk(data: ClinicalInput) -> dict:
+    snap = REGISTRY.current()
+    if not snap.has('diabetes', 'cardio'):
+        raise HTTPException(status_code=503, detail="Models not loaded on server")
     
-    **NON-DIAGNOSTIC**: This is a research prototype. Results are for demonstration only.
-    """
-    if 'diabetes' not in MODELS:
+    # --- A/B. DIABETES + CARDIO PREDICTION ---
+    if BATCHER is not None:
+        # Both models run in the dispatcher thread, so only the total wait is visible here
+        with phase("batch_wait"):
+            diab_prob, cardio_prob = BATCHER.score(data)
+    else:
+        diab_probs, cardio_probs = score_clinical_batch([data], snap)
+        diab_prob, cardio_prob = diab_probs[0], cardio_probs[0]
+    
+    with phase("drivers"):
+        return clinical_response(data, diab_prob, cardio_prob)
+
+def score_clinical_risk_batch(records: List[ClinicalInput]) -> dict:
+    snap = REGISTRY.current()
+    if not snap.has('diabetes', 'cardio'):
+        raise HTTPException(status_code=503, detail="Models not loaded on server")
+    if not records:
+        return {"results": [], "count": 0, "status": "processed"}
+    
+    diab_probs, cardio_probs = score_clinical_batch(records, snap)
+    with phase("drivers"):
+        results = [
+            clinical_response(r, d, c)
+            for r, d, c in zip(records, diab_probs, cardio_probs)
+        ]
+    return {"results": results, "count": len(results), "status": "processed"}
+
+# Upper bound on grid points per what-if sweep (product of all axis lengths)
+SWEEP_MAX_POINTS = int(os.getenv("ML_SWEEP_MAX_POINTS", "10000"))
+
+def score_whatif(req: WhatIfRequest) -> dict:
+    snap = REGISTRY.current()
+    if not snap.has('diabetes', 'cardio'):
+        raise HTTPException(status_code=503, detail="Models not loaded on server")
+    features = [axis.feature for axis in req.vary]
+    if len(set(features)) != len(features):
+        raise HTTPException(status_code=422, detail=f"Each feature can be varied once, got {features}")
+    try:
+        axes = [axis.points() for axis in req.vary]
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    shape = [len(a) for a in axes]
+    n_points = int(np.prod(shape))
+    if n_points > SWEEP_MAX_POINTS:
+        raise HTTPException(status_code=422, detail=f"Sweep has {n_points} points, limit is {SWEEP_MAX_POINTS}")
+
+    with phase("features"):
+        mesh = np.meshgrid(*axes, indexing="ij")
+        grid = {f: m.ravel() for f, m in zip(features, mesh)}
+        diab_input = snap.templates['clinical_diabetes'].build_grid(req.base, grid)
+        cardio_input = snap.templates['clinical_cardio'].build_grid(req.base, grid)
+    diab_probs = predict_positive(snap, 'diabetes', diab_input)
+    cardio_probs = predict_positive(snap, 'cardio', cardio_input)
+    overall = np.minimum((diab_probs + cardio_probs) / 2 * acute_multiplier(req.base) * 100, 99)
+
+    def surface(values):
+        return np.round(values, 1).reshape(shape).tolist()
+
+    return {
+        "features": features,
+        "axes": {f: a.tolist() for f, a in zip(features, axes)},
+        "shape": shape,
+        "diabetes_risk_percent": surface(diab_probs * 100),
+        "cardio_risk_percent": surface(cardio_probs * 100),
+        "overall_instability_score": surface(overall),
+        "status": "processed"
+    }
+
+def score_explanations(records: List[ClinicalInput]) -> List[dict]:
+    snap = REGISTRY.current()
+    if not snap.has('diabetes', 'cardio'):
+        raise HTTPException(status_code=503, detail="Models not loaded on server")
+    if not all(name in snap.explainers for name in EXPLAIN_TEMPLATES):
+        raise HTTPException(status_code=503, detail="Explainers not available (is shap installed?)")
+
+    per_model = {}
+    for name, key in EXPLAIN_TEMPLATES.items():
+        template = snap.templates[key]
+        explainer = snap.explainers[name]
+        with phase("features"):
+            X = template.build(records)
+        probs = predict_positive(snap, name, X)
+        with phase("explain"):
+            phi = explainer.explain(X)
+            rows = attributions(template.columns, template.fields(), X, phi)
+        per_model[name] = [
+            {
+                "probability": round(float(p), 6),
+                "base_value": round(explainer.base_value, 6),
+                "output_space": explainer.output_space,
+                "attributions": r,
+            }
+            for p, r in zip(probs, rows)
+        ]
+    return [
+        {"diabetes": d, "cardio": c}
+        for d, c in zip(per_model['diabetes'], per_model['cardio'])
+    ]
+
+def score_explain(data: Union[ClinicalInput, List[ClinicalInput]]) -> dict:
+    if isinstance(data, list):
+        results = score_explanations(data) if data else []
+        return {"results": results, "count": len(results), "status": "processed"}
+    return {**score_explanations([data])[0], "status": "processed"}
+
+# Passed through to streamed results so callers can join them back to their rows
+RECORD_ID_FIELDS = ("id", "patient_id", "user_id")
+
+def score_record_chunk(rows: List[dict], offset: int, snap: ModelSnapshot) -> str:
+    """Validate and score one chunk of raw cohort records; returns NDJSON lines in input order."""
+    out = [None] * len(rows)
+    valid, positions = [], []
+    for i, row in enumerate(rows):
+        try:
+            valid.append(ClinicalInput.model_validate(row))
+            positions.append(i)
+        except ValidationError as e:
+            msg = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            out[i] = {"row": offset + i, "status": "invalid", "error": msg}
+    if valid:
+        diab_probs, cardio_probs = score_clinical_batch(valid, snap)
+        for i, data, d, c in zip(positions, valid, diab_probs, cardio_probs):
+            line = {"row": offset + i}
+            for key in RECORD_ID_FIELDS:
+                if key in rows[i]:
+                    line[key] = rows[i][key]
+            line.update(clinical_response(data, d, c))
+            out[i] = line
+    return "".join(json.dumps(line) + "\n" for line in out)
+
+def score_stream(f, fmt: str, chunk_size: int = 1000, snap: ModelSnapshot = None):
+    """Yield NDJSON result blocks, one per chunk of `chunk_size` records read from f."""
+    snap = snap or REGISTRY.current()
+    offset = 0
+    for chunk in iter_chunks(iter_records(f, fmt), chunk_size):
+        yield score_record_chunk(chunk, offset, snap)
+        offset += len(chunk)
+
+def score_diabetes(data: HealthData) -> dict:
+    snap = REGISTRY.current()
+    if not snap.has('diabetes'):
         raise HTTPException(
             status_code=503,
             detail="Diabetes model not loaded. Please train the model first using train_model.py"
         )
     
     try:
-        # Model expects: ['Pregnancies', 'Glucose', 'BloodPressure', 'SkinThickness', 
-        #                'Insulin', 'BMI', 'DiabetesPedigreeFunction', 'Age']
-        # We provide: Glucose, BMI, Age, BloodPressure (bp)
-        # Fill missing with typical median values from Pima dataset
-        input_df = pd.DataFrame([{
-            'Pregnancies': 3.0,  # Median from Pima dataset
-            'Glucose': data.glucose,
-            'BloodPressure': data.bp,
-            'SkinThickness': 29.0,  # Median from Pima dataset
-            'Insulin': 125.0,  # Median from Pima dataset
-            'BMI': data.bmi,
-            'DiabetesPedigreeFunction': 0.3725,  # Median from Pima dataset
-            'Age': data.age
-        }])
+        with phase("features"):
+            input_row = snap.templates['legacy_diabetes'].build([data])
         
-        probability = MODELS['diabetes'].predict_proba(input_df)[0][1]
+        probability = score_with_shadow(snap, {'diabetes': ('legacy_diabetes', [data], input_row)})['diabetes'][0]
         
         return {
             "risk_score": round(probability * 100, 1),
@@ -233,41 +681,19 @@ def predict_diabetes(data: HealthData):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
 
-@app.post("/predict/cardio")
-def predict_cardio(data: CardioData):
-    """
-    Predict cardiovascular risk based on health metrics
-    
-    **NON-DIAGNOSTIC**: This is a research prototype. Results are for demonstration only.
-    """
-    if 'cardio' not in MODELS:
+def score_cardio(data: CardioData) -> dict:
+    snap = REGISTRY.current()
+    if not snap.has('cardio'):
         raise HTTPException(
             status_code=503,
             detail="Cardiac model not loaded. Please train the model first using train_model.py"
         )
     
     try:
-        # Model expects: ['age', 'sex', 'cp', 'trestbps', 'chol', 'fbs', 'restecg', 
-        #                'thalach', 'exang', 'oldpeak', 'slope', 'ca', 'thal']
-        # We provide: age, systolic_bp (trestbps), cholesterol (chol), resting_hr (thalach)
-        # Fill missing with typical median values from Cleveland dataset
-        input_df = pd.DataFrame([{
-            'age': data.age,
-            'sex': 1.0,  # 1 = male (typical default)
-            'cp': 1.0,  # Typical chest pain type (1 = typical angina)
-            'trestbps': data.systolic_bp,
-            'chol': data.cholesterol,
-            'fbs': 0.0,  # Fasting blood sugar < 120 mg/dl (0 = false)
-            'restecg': 0.0,  # Resting ECG normal (0 = normal)
-            'thalach': data.resting_hr,  # Maximum heart rate achieved
-            'exang': 0.0,  # Exercise induced angina (0 = no)
-            'oldpeak': 1.0,  # ST depression induced by exercise (median)
-            'slope': 1.0,  # Slope of peak exercise ST segment (1 = upsloping)
-            'ca': 0.0,  # Number of major vessels colored by flourosopy (0 = none)
-            'thal': 2.0  # Thalassemia (2 = normal)
-        }])
+        with phase("features"):
+            input_row = snap.templates['legacy_cardio'].build([data])
         
-        probability = MODELS['cardio'].predict_proba(input_df)[0][1]
+        probability = score_with_shadow(snap, {'cardio': ('legacy_cardio', [data], input_row)})['cardio'][0]
         
         return {
             "risk_score": round(probability * 100, 1),
@@ -277,5 +703,158 @@ def predict_cardio(data: CardioData):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
 
+# Async execution mode: a dedicated, bounded inference pool that sheds load with
+# 503 + Retry-After instead of letting the queue (and latency) grow without bound.
+# Off unless ML_ASYNC_INFERENCE=1; otherwise work runs on Starlette's threadpool
+# exactly as the old sync endpoints did.
+POOL = None
+if os.getenv("ML_ASYNC_INFERENCE", "0") == "1":
+    POOL = InferencePool(
+        workers=int(os.getenv("ML_INFERENCE_WORKERS", str(os.cpu_count() or 4))),
+        queue_size=int(os.getenv("ML_INFERENCE_QUEUE", "64")),
+    )
+RETRY_AFTER_S = os.getenv("ML_RETRY_AFTER_S", "1")
+
+async def run_inference(fn, *args):
+    if POOL is None:
+        return await run_in_threadpool(fn, *args)
+    try:
+        return await POOL.run(fn, *args)
+    except PoolSaturated:
+        raise HTTPException(
+            status_code=503,
+            detail="Inference queue is full, retry shortly",
+            headers={"Retry-After": RETRY_AFTER_S}
+        )
+
+async def run_bulk(fn, *args):
+    """Like run_inference, but bulk work waits for a free slot instead of being shed."""
+    if POOL is None:
+        return await run_in_threadpool(fn, *args)
+    while True:
+        try:
+            return await POOL.run(fn, *args)
+        except PoolSaturated:
+            await asyncio.sleep(0.05)
+
+# Request bodies above this size spill from memory to a temp file
+STREAM_SPOOL_BYTES = int(os.getenv("ML_STREAM_SPOOL_MB", "16")) * 1024 * 1024
+
+# This was the missing endpoint causing the 404
+@app.post("/predict/clinical_risk")
+@traced
+async def predict_clinical_risk(data: ClinicalInput):
+    """
+    Fuses Chronic Disease Models (RF/GBM) with Acute Signals.
+    """
+    return await run_inference(score_clinical_risk, data)
+
+@app.post("/predict/clinical_risk/batch")
+@traced
+async def predict_clinical_risk_batch(records: List[ClinicalInput]):
+    """
+    Batch version of /predict/clinical_risk for population re-scores.
+
+    Builds one feature matrix per model and makes a single scoring call
+    on each, instead of two model calls per patient. Results are
+    returned in input order.
+    """
+    return await run_inference(score_clinical_risk_batch, records)
+
+@app.post("/predict/clinical_risk/whatif")
+@traced
+async def predict_clinical_risk_whatif(req: WhatIfRequest):
+    """
+    Risk surface over a grid of glucose / BMI / systolic BP / cholesterol values.
+
+    Every other input is held at `base`. All grid points are scored in one
+    model call per model; surfaces are nested lists indexed in `vary` order.
+    """
+    return await run_inference(score_whatif, req)
+
+@app.post("/predict/clinical_risk/stream")
+async def predict_clinical_risk_stream(
+    request: Request,
+    fmt: Optional[str] = Query(None, alias="format", description="csv, ndjson or arrow; defaults from Content-Type"),
+    chunk_size: int = Query(1000, ge=1, le=10000),
+):
+    """
+    Score a whole cohort file (CSV, NDJSON or Arrow IPC stream) in one call.
+
+    The body is spooled to a temp file rather than held in memory, read back in
+    chunks of `chunk_size` records, and each chunk is scored with one model call
+    per model. Results stream back as NDJSON (one line per input row, in order)
+    as soon as each chunk is done. Rows that fail validation get an "invalid"
+    line instead of failing the whole file.
+    """
+    fmt = detect_format(fmt, request.headers.get("content-type"))
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Send text/csv, application/x-ndjson or application/vnd.apache.arrow.stream, or pass ?format=")
+    snap = REGISTRY.current()
+    if not snap.has('diabetes', 'cardio'):
+        raise HTTPException(status_code=503, detail="Models not loaded on server")
+
+    spool = tempfile.SpooledTemporaryFile(max_size=STREAM_SPOOL_BYTES)
+    async for part in request.stream():
+        spool.write(part)
+    spool.seek(0)
+    blocks = score_stream(spool, fmt, chunk_size, snap)
+
+    async def body():
+        try:
+            while True:
+                block = await run_bulk(next, blocks, None)
+                if block is None:
+                    break
+                yield block
+        except Exception as e:
+            yield json.dumps({"status": "aborted", "error": str(e)}) + "\n"
+        finally:
+            spool.close()
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+@app.post("/explain/clinical_risk")
+@traced
+async def explain_clinical_risk(data: Union[ClinicalInput, List[ClinicalInput]]):
+    """
+    Exact TreeSHAP attributions for the diabetes and cardio models.
+
+    Accepts one ClinicalInput or a list of them. Per model, each feature's
+    attribution plus `base_value` adds up to the model output in
+    `output_space` (probability for the RF, log-odds for the GBM). Features
+    are sorted by absolute attribution; `input` names the request field that
+    fed the feature, or null for a fixed default.
+    """
+    return await run_inference(score_explain, data)
+
+# Legacy endpoints for backward compatibility
+@app.post("/predict/diabetes")
+@traced
+async def predict_diabetes(data: HealthData):
+    """
+    Predict diabetes/metabolic risk based on health metrics
+    
+    **NON-DIAGNOSTIC**: This is a research prototype. Results are for demonstration only.
+    """
+    return await run_inference(score_diabetes, data)
+
+@app.post("/predict/cardio")
+@traced
+async def predict_cardio(data: CardioData):
+    """
+    Predict cardiovascular risk based on health metrics
+    
+    **NON-DIAGNOSTIC**: This is a research prototype. Results are for demonstration only.
+    """
+    return await run_inference(score_cardio, data)
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    import argparse
+    ap = argparse.ArgumentParser(description="SubHealthAI clinical inference API")
+    ap.add_argument("--host", type=str, default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--workers", type=int, default=int(os.getenv("ML_WORKERS", "1")),
+                    help="pre-forked worker processes sharing the models loaded in the parent")
+    args = ap.parse_args()
+    serve_prefork(app, host=args.host, port=args.port, workers=args.workers)
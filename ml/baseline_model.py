@@ -8,14 +8,49 @@ Baseline anomaly/risk model (schema-agnostic):
 
 Run:
   python -m ml.baseline_model --since 2025-01-01 --until 2025-12-31
+  python -m ml.baseline_model --workers 16 --writers 4
+  python -m ml.baseline_model --incremental          # nightly: only days after each user's last score
+  python -m ml.baseline_model --cohort
+
+Incremental mode (needs the baseline_state table, see supabase/migrations):
+- reads each user's persisted baseline state (median / MAD per feature, days
+  seen, last day folded in); that last day is the user's high-water mark
+- groups users by that day, finds which of them have rows after it, and
+  fetches --context-days of history only for those; users with nothing new
+  cost one empty range read and are skipped
+- blends the state's median / MAD with the recent window's, weighted by the
+  number of new days, and z-scores the window with the blended values
+- fits the IsolationForest and the squash on that window, and upserts only
+  the new days plus the updated state
+The blended median / MAD approximate, but are not equal to, whole-history
+statistics, and the anomaly model sees a window rather than the full history,
+so incremental scores drift from a full rescore over time. Run a full
+(non-incremental) pass periodically to re-anchor; users without state are
+bootstrapped with a full pass automatically.
+
+Cohort mode fits one IsolationForest on the pooled z-space rows of all users
+(or one per value of --segment-column) instead of one forest per user, and
+scores every user's rows with that model. z-scores and the squash stay per
+user. It holds all users' frames in memory for the fit. --segment-column must
+name a per-user label column of metrics_for_ml. The view in supabase/schema.sql
+has none yet (only user_id, day and the features), so it has to be added
+first, e.g. `dataset` joined from dataset_map. Unknown columns are rejected.
 """
 
-import argparse, math, json, datetime as dt
+import argparse, math, json, os, datetime as dt
+from functools import lru_cache
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore
 import numpy as np
 import pandas as pd
 from sklearn.ensemble import IsolationForest
 from typing import Dict
 from ml.config import supabase, MODEL_VERSION_BASELINE, WEIGHTS_V1
+from ml.sliding_quantile import rolling_quantile as _rolling_quantile, rolling_quantile_batch
+from ml.metrics_reader import fetch_keyed, fetch_user_ids, iter_user_frames
+from ml.db import upsert_chunked
+from ml.parallel import imap_processes
 
 # Canonical features used internally
 CANONICAL = ["hrv_mean", "rhr_mean", "sleep_hours", "steps"]
@@ -25,16 +60,10 @@ FEATURES = CANONICAL
 def rolling_quantile(xs, q: float = 0.7, w: int = 28):
     """Compute rolling quantile with window size w.
     For each position i, uses the last up to w values including i.
+    Same values as np.quantile on each window, from a sorted sliding window
+    (see ml/sliding_quantile.py) instead of re-sorting every step.
     """
-    out = []
-    buf = []
-    for x in xs:
-        buf.append(x)
-        if len(buf) > w:
-            buf.pop(0)
-        # numpy quantile on current buffer
-        out.append(float(np.quantile(buf, q)))
-    return out
+    return _rolling_quantile(xs, q=q, w=w)
 
 def adaptive_threshold(yhat_cal, q: float = 0.7, w: int = 28):
     """Return binary decisions comparing predictions to a rolling quantile threshold.
@@ -45,6 +74,14 @@ def adaptive_threshold(yhat_cal, q: float = 0.7, w: int = 28):
     thresholds = rolling_quantile(yhat_cal, q=q, w=w)
     return [int(p >= t) for p, t in zip(yhat_cal, thresholds)]
 
+def adaptive_threshold_batch(series, q: float = 0.7, w: int = 28):
+    """adaptive_threshold for many users' series at once (one int array per series).
+    Series can differ in length; the windows are sorted in bulk per chunk of users.
+    """
+    arrays = [np.asarray(s, dtype=float) for s in series]
+    thresholds = rolling_quantile_batch(arrays, q=q, w=w)
+    return [(a >= t).astype(int) for a, t in zip(arrays, thresholds)]
+
 def _sigmoid(x: float) -> float:
     return 1.0 / (1.0 + math.exp(-x))
 
@@ -78,31 +115,67 @@ def _first_existing(df_cols: set[str], candidates: list[str]) -> str | None:
 
 def _coerce_day_column(df: pd.DataFrame) -> pd.DataFrame:
     # Find day/date column and normalize to date
-    day_col = _first_existing(set(df.columns), ALIASES["day"])
+    day_col = _map_columns(frozenset(df.columns)).get("day")
     if not day_col:
         raise RuntimeError("No day/date column found in metrics (looked for: %s)" % ALIASES["day"])
     df["day"] = pd.to_datetime(df[day_col]).dt.date
     return df
 
-def _map_feature_columns(df: pd.DataFrame) -> dict:
-    cols = set(df.columns)
+@lru_cache(maxsize=None)
+def _map_columns(cols: frozenset) -> dict:
+    """{canonical: source column} for the day and feature aliases present; cached per schema."""
     mapping: dict[str, str] = {}
-    for k in ["hrv_mean", "rhr_mean", "sleep_hours", "steps"]:
+    for k in ["day", "hrv_mean", "rhr_mean", "sleep_hours", "steps"]:
         found = _first_existing(cols, ALIASES[k])
         if found: mapping[k] = found
     return mapping
 
+def _map_feature_columns(df: pd.DataFrame) -> dict:
+    mapping = dict(_map_columns(frozenset(df.columns)))
+    mapping.pop("day", None)
+    return mapping
+
+METRICS_VIEW = "metrics_for_ml"
+_RESOLVED: dict[str, dict] = {}
+_COLUMNS: dict[str, frozenset] = {}
+
+def resolve_metrics_columns(table: str = METRICS_VIEW) -> dict:
+    """
+    Resolve ALIASES against the view's columns once per run (from a single
+    sample row) and print the mapping once.
+    """
+    if table not in _RESOLVED:
+        res = supabase.table(table).select("*").limit(1).execute()
+        _COLUMNS[table] = frozenset(res.data[0]) if res.data else frozenset()
+        mapping = _map_columns(_COLUMNS[table])
+        print(f"[metrics column map] {table} -> {mapping}")
+        _RESOLVED[table] = mapping
+    return _RESOLVED[table]
+
+def segment_column_error(column: str, table: str = METRICS_VIEW) -> str | None:
+    """Why `column` can't split the cohort fit (None if it can), checked against the resolved view."""
+    mapping = resolve_metrics_columns(table)
+    columns = _COLUMNS.get(table, frozenset())
+    if not columns:
+        return f"{table} returned no rows, so --segment-column {column!r} cannot be checked"
+    if column not in columns:
+        return f"{table} has no column {column!r} (columns: {', '.join(sorted(columns))})"
+    if column == "user_id" or column in mapping.values():
+        return f"{column!r} is the user id, day or a feature column, not a per-user segment label"
+    return None
+
+def metrics_projection(mapping: dict, extra: list[str] | None = None) -> str:
+    """select() list: user_id, the day column and the mapped features only ("*" if unresolved)."""
+    if "day" not in mapping:
+        return "*"
+    cols = ["user_id"] + list(dict.fromkeys(mapping.values())) + [c for c in (extra or []) if c not in mapping.values()]
+    return ",".join(dict.fromkeys(cols))
+
 def fetch_users():
-    res = supabase.table("users").select("id").execute()
-    return [r["id"] for r in (res.data or [])]
-
-def fetch_metrics(user_id: str, since: str | None, until: str | None) -> pd.DataFrame:
-    # Pull *all* columns so we can alias flexibly
-    q = supabase.table("metrics_for_ml").select("*").eq("user_id", user_id)
-    if since: q = q.gte("day", since)
-    if until: q = q.lte("day", until)
-    res = q.execute()
-    df = pd.DataFrame(res.data or [])
+    return fetch_user_ids(supabase)
+
+def normalize_metrics(df: pd.DataFrame, user_id: str) -> pd.DataFrame:
+    """Raw metrics_for_ml rows for one user -> canonical feature frame sorted by day."""
     if df.empty:
         return df
 
@@ -110,10 +183,8 @@ def fetch_metrics(user_id: str, since: str | None, until: str | None) -> pd.Data
     df = _coerce_day_column(df)
     df = df.sort_values("day").reset_index(drop=True)
 
-    # Build a canonical view with whatever columns exist
+    # Build a canonical view with whatever columns exist (resolved once per column set)
     mapping = _map_feature_columns(df)
-    # Transparently print mapping once per user for debugging
-    print(f"[metrics column map] user={user_id} -> {mapping}")
 
     # Create canonical columns; if a feature is missing, fill with NaN
     out = pd.DataFrame({"user_id": df["user_id"], "day": df["day"]})
@@ -140,6 +211,52 @@ def robust_standardize(df: pd.DataFrame, cols: list[str]) -> pd.DataFrame:
         out[c + "_z"] = (x - med) / (1.4826 * mad)
     return out
 
+def robust_stats(x: pd.Series) -> dict:
+    """Median / MAD as robust_standardize computes them; None when under 3 values."""
+    x = x.astype(float)
+    n = int(x.notna().sum())
+    if n < 3:
+        return {"median": None, "mad": None, "n": n}
+    med = float(np.nanmedian(x))
+    mad = float(np.nanmedian(np.abs(x - med)) or 1.0)
+    return {"median": med, "mad": mad, "n": n}
+
+def standardize_with(df: pd.DataFrame, stats: dict) -> pd.DataFrame:
+    """robust_standardize, but with given per-feature median / MAD."""
+    out = df.copy()
+    for c in FEATURES:
+        st = stats.get(c) or {}
+        if st.get("median") is None:
+            out[c + "_z"] = 0.0
+            continue
+        out[c + "_z"] = (out[c].astype(float) - st["median"]) / (1.4826 * st["mad"])
+    return out
+
+def blend_stats(old: dict, fold: pd.DataFrame, window: pd.DataFrame) -> dict:
+    """
+    Fold new days into persisted per-feature stats (approximate).
+
+    The recent window's median / MAD are averaged with the stored ones,
+    weighted by new values vs values already folded in.
+    """
+    out = {}
+    for c in FEATURES:
+        o = (old or {}).get(c) or {"median": None, "mad": None, "n": 0}
+        k = int(fold[c].notna().sum())
+        recent = robust_stats(window[c])
+        if k == 0 or recent["median"] is None:
+            out[c] = {**o, "n": o["n"] + k}
+        elif o["median"] is None:
+            out[c] = {**recent, "n": o["n"] + k}
+        else:
+            n = o["n"] + k
+            out[c] = {
+                "median": (o["n"] * o["median"] + k * recent["median"]) / n,
+                "mad": (o["n"] * o["mad"] + k * recent["mad"]) / n,
+                "n": n,
+            }
+    return out
+
 def iso_forest_score(X: np.ndarray, random_state=42) -> np.ndarray:
     # IsolationForest returns negative scores for anomalies (lower is more anomalous).
     valid_rows = ~np.isnan(X).any(axis=1)
@@ -163,61 +280,73 @@ def squash(x: np.ndarray) -> np.ndarray:
     xm = (x - np.nanmedian(x)) / (np.nanstd(x) + 1e-6)
     return 1 / (1 + np.exp(-1.2 * xm))
 
-def _json_sanitize(d: dict) -> dict:
-    out = {}
-    for k, v in (d or {}).items():
-        if v is None:
-            out[k] = None
-            continue
-        try:
-            # numpy scalars/arrays -> float
-            fv = float(v)
-            if not np.isfinite(fv):
-                out[k] = None
-            else:
-                out[k] = fv
-        except Exception:
-            out[k] = None
-    return out
+def _json_column(df: pd.DataFrame, col: str, keep: np.ndarray) -> list | None:
+    """Column as JSON-safe Python values (non-finite -> None), or None if absent."""
+    if col not in df.columns:
+        return None
+    x = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float)[keep]
+    return np.where(np.isfinite(x), x, None).tolist()
 
-def upsert_risk_scores(user_id: str, df_scores: pd.DataFrame):
-    rows = []
-    for _, r in df_scores.iterrows():
-        if not np.isfinite(r["risk"]):
-            continue
-        feat = {k: r.get(k, None) for k in FEATURES}
-        zfeat = {k+"_z": r.get(k+"_z", None) for k in FEATURES}
-        payload = {
+def risk_rows(user_id: str, df_scores: pd.DataFrame) -> list[dict]:
+    """risk_scores payloads, assembled column-wise (rows with non-finite risk are skipped)."""
+    risk = df_scores["risk"].to_numpy(dtype=float)
+    keep = np.isfinite(risk)
+    if not keep.any():
+        return []
+    days = [d.isoformat() for d in df_scores["day"].to_numpy()[keep]]
+    raw_keys, z_keys = FEATURES, [k + "_z" for k in FEATURES]
+    cols = {k: _json_column(df_scores, k, keep) for k in raw_keys + z_keys}
+    if all(v is None for v in cols.values()):
+        # Scores only (the usual case): every row carries the same features JSON
+        features = [json.dumps({"raw": dict.fromkeys(raw_keys), "z": dict.fromkeys(z_keys)})] * len(days)
+    else:
+        none = [None] * len(days)
+        raw_cols = [cols[k] or none for k in raw_keys]
+        z_cols = [cols[k] or none for k in z_keys]
+        features = [
+            json.dumps({"raw": dict(zip(raw_keys, r)), "z": dict(zip(z_keys, z))})
+            for r, z in zip(zip(*raw_cols), zip(*z_cols))
+        ]
+    return [
+        {
             "user_id": user_id,
-            "day": r["day"].isoformat(),
-            "risk_score": float(r["risk"]),
+            "day": d,
+            "risk_score": r,
             "model_version": MODEL_VERSION_BASELINE,
-            "features": json.dumps({
-                "raw": _json_sanitize(feat),
-                "z": _json_sanitize(zfeat)
-            })
+            "features": f,
         }
-        rows.append(payload)
-    # Batch upsert
-    supabase.table("risk_scores").upsert(rows, on_conflict="user_id,day,model_version").execute()
+        for d, r, f in zip(days, risk[keep].tolist(), features)
+    ]
 
-def run_for_user(user_id: str, since: str | None, until: str | None):
-    df = fetch_metrics(user_id, since, until)
+def write_risk_rows(rows: list[dict]):
+    # Size-bounded chunks, each retried on transient failure
+    upsert_chunked(supabase, "risk_scores", rows, on_conflict="user_id,day,model_version")
+
+def score_metrics(df: pd.DataFrame) -> pd.DataFrame:
+    """Score one user's canonical feature frame; empty frame when there is too little history."""
     if df.empty:
-        return 0
+        return pd.DataFrame()
     if len(df) < 5:
-        return 0  # not enough history to compute meaningful risk
+        return pd.DataFrame()  # not enough history to compute meaningful risk
     # Robust z-scores per feature
-    df = robust_standardize(df, FEATURES)
+    return risk_from_z(robust_standardize(df, FEATURES))
+
+def z_matrix(df: pd.DataFrame) -> np.ndarray:
     # Build feature matrix with z-scores (directionality: higher HRV is good vs RHR is bad)
     # Invert z for features where higher = better so anomalies in the "worse" direction are positive.
-    z = np.column_stack([
+    return np.column_stack([
         -df["hrv_mean_z"].to_numpy(),  # lower HRV = riskier -> invert
          df["rhr_mean_z"].to_numpy(),  # higher RHR = riskier
         -df["sleep_hours_z"].to_numpy(),  # less sleep = riskier -> invert
         -df["steps_z"].to_numpy()   # fewer steps = riskier -> invert
     ])
-    raw = iso_forest_score(z)
+
+def risk_from_z(df: pd.DataFrame) -> pd.DataFrame:
+    """Frame with <feature>_z columns -> day + risk."""
+    return risk_from_raw(df, iso_forest_score(z_matrix(df)))
+
+def risk_from_raw(df: pd.DataFrame, raw: np.ndarray) -> pd.DataFrame:
+    """Anomaly scores -> day + 0..1 risk."""
     risk = squash(raw)
     # --- make risk JSON-safe (no NaNs/Inf) ---
     risk = np.asarray(risk, dtype=float)
@@ -232,18 +361,281 @@ def run_for_user(user_id: str, since: str | None, until: str | None):
     # -----------------------------------------
     df_scores = df[["day"]].copy()
     df_scores["risk"] = risk
-    upsert_risk_scores(user_id, df_scores)
-    return len(df_scores)
+    return df_scores
+
+# --- Cohort mode ---
+def cohort_iso_scores(zs: dict[str, np.ndarray], segments: dict[str, str] | None = None,
+                      random_state=42) -> dict[str, np.ndarray]:
+    """
+    iso_forest_score for many users with one forest per segment (one overall by default).
+
+    Each segment's valid rows are pooled, fitted once and scored in one
+    score_samples call, then split back per user. Rows with NaNs get the
+    user's median score, as in iso_forest_score; users with no valid rows
+    (or segments under 16 rows) fall back to iso_forest_score itself.
+    """
+    groups = defaultdict(list)
+    for uid in zs:
+        groups[(segments or {}).get(uid)].append(uid)
+    out = {}
+    for uids in groups.values():
+        valid = {u: ~np.isnan(zs[u]).any(axis=1) for u in uids}
+        fitted = [u for u in uids if valid[u].any()]
+        pooled = np.concatenate([zs[u][valid[u]] for u in fitted]) if fitted else np.empty((0, 4))
+        if len(pooled) < 16:
+            out.update({u: iso_forest_score(zs[u]) for u in uids})
+            continue
+        clf = IsolationForest(n_estimators=200, contamination="auto", random_state=random_state)
+        clf.fit(pooled)
+        raw = -clf.score_samples(pooled)  # higher = more anomalous
+        bounds = np.cumsum([0] + [int(valid[u].sum()) for u in fitted])
+        for u, a, b in zip(fitted, bounds[:-1], bounds[1:]):
+            scores = np.full(len(zs[u]), np.nan)
+            scores[valid[u]] = raw[a:b]
+            scores[~valid[u]] = np.median(raw[a:b])
+            out[u] = scores
+        for u in uids:
+            if u not in out:
+                out[u] = iso_forest_score(zs[u])
+    return out
+
+def run_cohort(frames, segment_column: str | None = None) -> int:
+    """Standardize every user, fit the cohort forest(s) once, then score and upsert per user."""
+    dfs, segments = {}, {}
+    for uid, raw in frames:
+        df = normalize_metrics(raw, uid)
+        if len(df) < 5:
+            continue  # same minimum history as score_metrics
+        dfs[uid] = robust_standardize(df, FEATURES)
+        if segment_column:
+            segments[uid] = str(raw[segment_column].iloc[0]) if segment_column in raw.columns else None
+    raws = cohort_iso_scores({u: z_matrix(df) for u, df in dfs.items()}, segments)
+    total = 0
+    for uid, df in dfs.items():
+        df_scores = risk_from_raw(df, raws[uid])
+        _write(risk_rows(uid, df_scores), None)
+        total += len(df_scores)
+    return total
+
+# --- Incremental mode ---
+STATE_TABLE = "baseline_state"
+CONTEXT_DAYS = 60
+
+def _day(v) -> dt.date | None:
+    return dt.date.fromisoformat(str(v)[:10]) if v else None
+
+def state_row(user_id: str, last_day: dt.date, n_days: int, stats: dict) -> dict:
+    return {
+        "user_id": user_id,
+        "model_version": MODEL_VERSION_BASELINE,
+        "last_day": last_day.isoformat(),
+        "n_days": int(n_days),
+        "stats": stats,
+        "updated_at": dt.datetime.now(dt.timezone.utc).isoformat(),
+    }
+
+def write_states(rows: list[dict]):
+    upsert_chunked(supabase, STATE_TABLE, rows, on_conflict="user_id,model_version")
+
+def pending_state(user_id: str, last_day: dt.date, n_days: int = 0) -> dict:
+    """State for a user with too little history to score: no stats, just the day seen up to."""
+    return state_row(user_id, last_day, n_days, {})
+
+def is_pending(state: dict) -> bool:
+    return not state.get("stats")
+
+def score_bootstrap(user_id: str, df: pd.DataFrame, hwm: dt.date | None):
+    """No (or pending) state: full-history score (as the non-incremental path) and initial state."""
+    df_scores = score_metrics(df)
+    if df_scores.empty:
+        # Too little history: remember how far we looked, so later runs only
+        # come back for this user once new days arrive
+        return df_scores, pending_state(user_id, df["day"].max(), len(df))
+    stats = {c: robust_stats(df[c]) for c in FEATURES}
+    if hwm is not None:
+        df_scores = df_scores[df_scores["day"] > hwm]
+    return df_scores, state_row(user_id, df["day"].max(), len(df), stats)
+
+def score_incremental(user_id: str, df: pd.DataFrame, state: dict, hwm: dt.date | None, context_days: int):
+    """Score days after the high-water mark against the persisted baseline; returns (scores, new state)."""
+    folded_to = _day(state["last_day"])
+    written_to = hwm or folded_to
+    start = min(folded_to, written_to) - dt.timedelta(days=context_days)
+    window = df[df["day"] > start].reset_index(drop=True)
+    fold = window[window["day"] > folded_to]
+    if fold.empty and not (window["day"] > written_to).any():
+        return pd.DataFrame(), None  # nothing new
+    if len(window) < 5:
+        return pd.DataFrame(), None  # not enough context; retry once more days arrive
+    stats = blend_stats(state.get("stats") or {}, fold, window)
+    df_scores = risk_from_z(standardize_with(window, stats))
+    df_scores = df_scores[df_scores["day"] > written_to]
+    new_state = state_row(user_id, max(folded_to, window["day"].max()), (state.get("n_days") or 0) + len(fold), stats)
+    return df_scores, new_state
+
+def score_high_water(user_id: str) -> dt.date | None:
+    """Newest baseline risk_scores day for a user (index-backed limit-1 read)."""
+    res = (supabase.table("risk_scores").select("day").eq("user_id", user_id)
+           .eq("model_version", MODEL_VERSION_BASELINE).order("day", desc=True).limit(1).execute())
+    return _day(res.data[0]["day"]) if res.data else None
+
+def incremental_frames(until: str | None, context_days: int, batch: int = 200):
+    """
+    (user_id, raw metrics, state, high-water mark, context_days) per user.
+
+    Users with state are grouped by their state's last_day, so each group's
+    reads start at its own mark rather than the oldest one of any user. Per
+    group (in id batches) one read finds the users with rows after the mark;
+    only those get their --context-days of history fetched. Rows are written
+    before state, so state.last_day doubles as the high-water mark. Users
+    without state are fetched in full, with their mark looked up per user to
+    avoid rewriting days the full scorer already wrote. Pending users (state
+    without stats: too little history last time) are bootstrapped the same
+    way, but only once they have rows after their mark.
+    """
+    users = set(fetch_users())
+    mapping = resolve_metrics_columns()
+    scan = {"columns": metrics_projection(mapping), "day_column": mapping.get("day", "day")}
+    eq = {"model_version": MODEL_VERSION_BASELINE}
+    states = {r["user_id"]: r for r in fetch_keyed(supabase, STATE_TABLE, "*", "user_id", eq=eq)}
+
+    by_mark = defaultdict(list)
+    for uid in sorted(users & set(states)):
+        by_mark[_day(states[uid]["last_day"])].append(uid)
+    for mark, group in sorted(by_mark.items()):
+        after = (mark + dt.timedelta(days=1)).isoformat()
+        if until and after > until:
+            continue
+        for i in range(0, len(group), batch):
+            fresh = dict(iter_user_frames(supabase, since=after, until=until, user_ids=group[i:i + batch], **scan))
+            pending = sorted(u for u in fresh if is_pending(states[u]))
+            for uid, raw in iter_user_frames(supabase, until=until, user_ids=pending, **scan):
+                yield uid, raw, None, score_high_water(uid), context_days
+            active = sorted(u for u in fresh if not is_pending(states[u]))
+            if not active:
+                continue
+            context = dict(iter_user_frames(supabase, since=(mark - dt.timedelta(days=context_days)).isoformat(),
+                                            until=mark.isoformat(), user_ids=active, **scan))
+            for uid in active:
+                raw = pd.concat([context[uid], fresh[uid]], ignore_index=True) if uid in context else fresh[uid]
+                yield uid, raw, states[uid], None, context_days
+    stateless = sorted(users - set(states))
+    for i in range(0, len(stateless), batch):
+        for uid, raw in iter_user_frames(supabase, until=until, user_ids=stateless[i:i + batch], **scan):
+            yield uid, raw, None, score_high_water(uid), context_days
+
+# --- Drivers ---
+def _score_frame_rows(task: tuple):
+    # Process-pool entry point: rows are plain dicts so results pickle cheaply
+    user_id, raw = task
+    df_scores = score_metrics(normalize_metrics(raw, user_id))
+    return (risk_rows(user_id, df_scores) if not df_scores.empty else []), None
+
+def _score_frame_incremental(task: tuple):
+    user_id, raw, state, hwm, context_days = task
+    df = normalize_metrics(raw, user_id)
+    if df.empty:
+        if state is None and not raw.empty:  # rows, but no usable features yet
+            return [], pending_state(user_id, _coerce_day_column(raw.copy())["day"].max())
+        return [], None
+    if state is None:
+        df_scores, new_state = score_bootstrap(user_id, df, hwm)
+    else:
+        df_scores, new_state = score_incremental(user_id, df, state, hwm, context_days)
+    return (risk_rows(user_id, df_scores) if not df_scores.empty else []), new_state
+
+def user_frames(since: str | None, until: str | None, extra_columns: list[str] | None = None):
+    """(user_id, raw metrics) for every known user with data, from one paginated scan."""
+    users = set(fetch_users())
+    mapping = resolve_metrics_columns()
+    for uid, raw in iter_user_frames(supabase, columns=metrics_projection(mapping, extra_columns),
+                                     since=since, until=until, day_column=mapping.get("day", "day")):
+        if uid in users:
+            yield uid, raw
+
+def _write(rows: list[dict], state: dict | None):
+    if rows:
+        write_risk_rows(rows)
+    # State goes last, so a failed score write is retried from the same high-water mark
+    if state is not None:
+        write_states([state])
+
+def run_serial(frames, score_fn=_score_frame_rows) -> int:
+    total = 0
+    for task in frames:
+        rows, state = score_fn(task)
+        _write(rows, state)
+        total += len(rows)
+    return total
+
+def run_parallel(frames, workers: int, writers: int, score_fn=_score_frame_rows) -> int:
+    """
+    Score users across `workers` processes and upsert through `writers` threads.
+
+    Every user is scored exactly as in the serial path (same seeds, same rows),
+    so the result does not depend on the worker count. Users are submitted as
+    the reader produces them, with at most 4 * workers in flight, and at most
+    2 * writers upserts are queued; scoring waits when the database falls behind.
+    """
+    total = 0
+    pending = BoundedSemaphore(2 * writers)
+    writes = []
+
+    def write(rows, state):
+        try:
+            _write(rows, state)
+        finally:
+            pending.release()
+
+    with ThreadPoolExecutor(max_workers=writers) as write_pool:
+        for rows, state in imap_processes(score_fn, frames, workers):
+            if rows or state is not None:
+                pending.acquire()
+                writes.append(write_pool.submit(write, rows, state))
+                total += len(rows)
+        for f in writes:
+            f.result()  # surface write errors
+    return total
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--since", type=str, default=None)
     ap.add_argument("--until", type=str, default=None)
+    ap.add_argument("--workers", type=int, default=1, help="scoring processes (1 = serial)")
+    ap.add_argument("--writers", type=int, default=4, help="concurrent upserts when --workers > 1")
+    ap.add_argument("--incremental", action="store_true",
+                    help="score only days after each user's last baseline score, from persisted state")
+    ap.add_argument("--context-days", type=int, default=CONTEXT_DAYS,
+                    help="history before the high-water mark refit with the new days (incremental)")
+    ap.add_argument("--cohort", action="store_true",
+                    help="fit one IsolationForest on all users' rows instead of one per user")
+    ap.add_argument("--segment-column", type=str, default=None,
+                    help="per-user label column of metrics_for_ml that splits the cohort fit (with --cohort)")
     args = ap.parse_args()
 
-    total = 0
-    for uid in fetch_users():
-        total += run_for_user(uid, args.since, args.until)
+    if args.cohort:
+        if args.incremental:
+            ap.error("--cohort and --incremental cannot be combined")
+        if args.segment_column:
+            err = segment_column_error(args.segment_column)
+            if err:
+                ap.error(f"--segment-column: {err}")
+        extra = [args.segment_column] if args.segment_column else None
+        total = run_cohort(user_frames(args.since, args.until, extra), args.segment_column)
+        print(f"Upserted {total} risk rows.")
+        return
+
+    if args.incremental:
+        if args.since:
+            ap.error("--since does not apply to --incremental (it starts at each user's high-water mark)")
+        frames, score_fn = incremental_frames(args.until, args.context_days), _score_frame_incremental
+    else:
+        # One paginated scan of metrics_for_ml for all users instead of a query per user
+        frames, score_fn = user_frames(args.since, args.until), _score_frame_rows
+    if args.workers > 1:
+        total = run_parallel(frames, args.workers, max(1, args.writers), score_fn)
+    else:
+        total = run_serial(frames, score_fn)
     print(f"Upserted {total} risk rows.")
 
 if __name__ == "__main__":
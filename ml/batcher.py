@@ -0,0 +1,99 @@
+"""
+Request coalescing for the clinical models.
+
+Concurrent callers each submit one record; a single dispatcher thread gathers
+whatever arrives within a short window (or until max_batch records are
+waiting), scores them with one call, and hands each caller its own result.
+While a batch is being scored new requests keep queueing, so bursts coalesce
+even with a zero window.
+"""
+
+import queue, threading, time
+from concurrent.futures import Future
+from typing import Any, Callable, List
+
+class MicroBatcher:
+    def __init__(self, score_fn: Callable[[List[Any]], List[Any]], window_ms: float = 2.0, max_batch: int = 64):
+        """
+        score_fn: maps a list of items to a list of results in the same order.
+        window_ms: how long to wait for more items after the first one arrives.
+        max_batch: dispatch as soon as this many items are waiting.
+        """
+        self.score_fn = score_fn
+        self.window = max(0.0, window_ms) / 1000.0
+        self.max_batch = max(1, int(max_batch))
+        self._queue: "queue.Queue[tuple[Any, Future]]" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.fallbacks = 0  # batches that raised and were rescored item by item
+
+    def _ensure_started(self):
+        # Started lazily so a process that forks after import gets its own dispatcher
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                    self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        self._ensure_started()
+        fut: Future = Future()
+        self._queue.put((item, fut))
+        return fut
+
+    def score(self, item: Any, timeout: float | None = None) -> Any:
+        """Submit one item and block until its batch has been scored."""
+        return self.submit(item).result(timeout=timeout)
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            try:
+                results = self.score_fn(items)
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(e)
+                else:
+                    self._score_each(batch)
+                continue
+            for (_, fut), result in zip(batch, results):
+                fut.set_result(result)
+            self.batches += 1
+            self.items += len(batch)
+
+    def _score_each(self, batch: list):
+        # One bad item must not fail everyone it was coalesced with: rescore
+        # singly so only the offending caller gets the exception
+        self.fallbacks += 1
+        for item, fut in batch:
+            try:
+                fut.set_result(self.score_fn([item])[0])
+            except Exception as e:
+                fut.set_exception(e)
+
+    def stats(self) -> dict:
+        return {
+            "window_ms": self.window * 1000.0,
+            "max_batch": self.max_batch,
+            "queued": self._queue.qsize(),
+            "batches": self.batches,
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "fallbacks": self.fallbacks,
+        }
@@ -0,0 +1,246 @@
+"""
+Load-test / benchmark harness for the inference API (ml/api.py).
+
+Trains small stand-in models on synthetic data (same estimator types, sizes and
+feature names as train_model.py, no network needed), starts the API on a local
+port against them, and drives /predict/clinical_risk, /predict/diabetes and
+/predict/cardio with closed-loop clients at several concurrency levels.
+Throughput and p50/p95/p99 latency per (endpoint, concurrency) are written to
+ml/benchmark/logs/<date>_<commit>_bench.json so runs can be compared across
+commits.
+
+Run:
+  python ml/benchmark/run.py --concurrency 1,4,16,64 --duration 10
+  python ml/benchmark/run.py --workers 4 --env ML_MICROBATCH=1
+  python ml/benchmark/run.py --compare ml/benchmark/logs/<older>_bench.json
+"""
+
+import os, sys, json, time, random, socket, argparse, datetime, platform, pathlib, subprocess, tempfile, threading
+import numpy as np
+import pandas as pd
+import requests
+
+ML_DIR = pathlib.Path(__file__).resolve().parent.parent
+OUT = pathlib.Path(__file__).parent / "logs"; OUT.mkdir(parents=True, exist_ok=True)
+TODAY = datetime.date.today().isoformat()
+
+DIABETES_COLUMNS = ['Pregnancies', 'Glucose', 'BloodPressure', 'SkinThickness', 'Insulin', 'BMI', 'DiabetesPedigreeFunction', 'Age']
+CARDIO_COLUMNS = ['age', 'sex', 'cp', 'trestbps', 'chol', 'fbs', 'restecg', 'thalach', 'exang', 'oldpeak', 'slope', 'ca', 'thal']
+ENDPOINTS = ["/predict/clinical_risk", "/predict/diabetes", "/predict/cardio"]
+
+def train_standin_models(models_dir: str, seed: int = 42, n: int = 800):
+    """Fit GBM/RF models shaped like the production ones on synthetic data."""
+    import joblib
+    from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+    rng = np.random.default_rng(seed)
+
+    diab = pd.DataFrame({
+        'Pregnancies': rng.integers(0, 12, n),
+        'Glucose': rng.normal(120, 30, n),
+        'BloodPressure': rng.normal(72, 12, n),
+        'SkinThickness': rng.normal(29, 8, n),
+        'Insulin': rng.normal(125, 60, n),
+        'BMI': rng.normal(32, 6, n),
+        'DiabetesPedigreeFunction': rng.gamma(2.0, 0.2, n),
+        'Age': rng.integers(21, 80, n),
+    })[DIABETES_COLUMNS]
+    logit = 0.04 * (diab['Glucose'] - 120) + 0.08 * (diab['BMI'] - 32) + 0.03 * (diab['Age'] - 40)
+    y_diab = (rng.random(n) < 1 / (1 + np.exp(-logit))).astype(int)
+    diabetes_model = GradientBoostingClassifier(n_estimators=100, learning_rate=0.1, max_depth=3, random_state=seed)
+    diabetes_model.fit(diab, y_diab)
+
+    cardio = pd.DataFrame({
+        'age': rng.integers(29, 78, n), 'sex': rng.integers(0, 2, n), 'cp': rng.integers(1, 5, n),
+        'trestbps': rng.normal(132, 18, n), 'chol': rng.normal(246, 50, n), 'fbs': rng.integers(0, 2, n),
+        'restecg': rng.integers(0, 3, n), 'thalach': rng.normal(150, 23, n), 'exang': rng.integers(0, 2, n),
+        'oldpeak': rng.gamma(1.5, 0.7, n), 'slope': rng.integers(1, 4, n), 'ca': rng.integers(0, 4, n),
+        'thal': rng.choice([3, 6, 7], n),
+    })[CARDIO_COLUMNS]
+    logit = 0.05 * (cardio['age'] - 54) + 0.02 * (cardio['trestbps'] - 132) + 0.01 * (cardio['chol'] - 246)
+    y_cardio = (rng.random(n) < 1 / (1 + np.exp(-logit))).astype(int)
+    cardio_model = RandomForestClassifier(n_estimators=100, max_depth=5, random_state=seed)
+    cardio_model.fit(cardio, y_cardio)
+
+    joblib.dump(diabetes_model, os.path.join(models_dir, "diabetes_model_v1.pkl"))
+    joblib.dump(cardio_model, os.path.join(models_dir, "cardio_model_v1.pkl"))
+
+def make_payloads(endpoint: str, count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    out = []
+    for _ in range(count):
+        if endpoint == "/predict/clinical_risk":
+            out.append({
+                "glucose": rng.uniform(70, 200), "bmi": rng.uniform(18, 42), "age": rng.randint(21, 80),
+                "systolic_bp": rng.uniform(95, 180), "cholesterol": rng.uniform(140, 320),
+                "avg_hrv": rng.uniform(15, 90), "daily_steps": rng.randint(500, 15000), "sleep_hours": rng.uniform(4, 9),
+            })
+        elif endpoint == "/predict/diabetes":
+            out.append({"glucose": rng.uniform(70, 200), "bmi": rng.uniform(18, 42),
+                        "age": rng.randint(21, 80), "bp": rng.uniform(60, 100)})
+        else:
+            out.append({"age": rng.randint(29, 78), "systolic_bp": rng.uniform(95, 180),
+                        "cholesterol": rng.uniform(140, 320), "resting_hr": rng.uniform(90, 190)})
+    return out
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(models_dir: str, port: int, workers: int, extra_env: dict, timeout: float = 60.0):
+    env = os.environ.copy()
+    env.update({"ML_MODELS_DIR": models_dir, "ML_MODEL_POLL_S": "0"})
+    env.update(extra_env)
+    proc = subprocess.Popen(
+        [sys.executable, str(ML_DIR / "api.py"), "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"API exited with code {proc.returncode} during startup")
+        try:
+            h = requests.get(f"{base}/health", timeout=1).json()
+            if h.get("diabetes_model_loaded") and h.get("cardiac_model_loaded"):
+                return proc, base
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("API did not become healthy in time")
+
+def drive(base: str, endpoint: str, concurrency: int, duration: float, warmup: float, seed: int) -> dict:
+    """Closed-loop load: `concurrency` clients each send the next request as soon as the last returns."""
+    payloads = make_payloads(endpoint, 512, seed)
+    url = base + endpoint
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    start_evt = threading.Event()
+    t_start = t_stop = 0.0
+
+    def client(i: int):
+        session = requests.Session()
+        k = i
+        # Warm connections and caches before measuring
+        warm_until = time.perf_counter() + warmup
+        while time.perf_counter() < warm_until:
+            session.post(url, json=payloads[k % len(payloads)])
+            k += concurrency
+        start_evt.wait()
+        while True:
+            t0 = time.perf_counter()
+            if t0 >= t_stop:
+                break
+            try:
+                r = session.post(url, json=payloads[k % len(payloads)])
+                ok = r.status_code == 200
+            except requests.RequestException:
+                ok = False
+            t1 = time.perf_counter()
+            if ok:
+                latencies[i].append((t1 - t0) * 1000.0)
+            else:
+                errors[i] += 1
+            k += concurrency
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    time.sleep(warmup)
+    t_start = time.perf_counter()
+    t_stop = t_start + duration
+    start_evt.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t_start
+
+    lat = np.concatenate([np.asarray(l) for l in latencies]) if any(latencies) else np.array([])
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": int(lat.size),
+        "errors": int(sum(errors)),
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(lat.size / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(float(lat.mean()), 3) if lat.size else None,
+        "p50_ms": round(float(np.percentile(lat, 50)), 3) if lat.size else None,
+        "p95_ms": round(float(np.percentile(lat, 95)), 3) if lat.size else None,
+        "p99_ms": round(float(np.percentile(lat, 99)), 3) if lat.size else None,
+    }
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ML_DIR, text=True).strip()
+    except Exception:
+        return "unknown"
+
+def compare(current: dict, baseline_path: str):
+    """Print throughput and latency ratios against an earlier results file."""
+    base = json.loads(pathlib.Path(baseline_path).read_text())
+    old = {(r["endpoint"], r["concurrency"]): r for r in base["results"]}
+    print(f"\nvs {base['meta']['commit']} ({baseline_path}):")
+    print(f"{'endpoint':28} {'conc':>5} {'rps':>10} {'p50':>8} {'p99':>8}")
+    for r in current["results"]:
+        o = old.get((r["endpoint"], r["concurrency"]))
+        if not o or not o["throughput_rps"] or not o["p50_ms"] or not r["p50_ms"]:
+            continue
+        print(f"{r['endpoint']:28} {r['concurrency']:>5} "
+              f"{r['throughput_rps'] / o['throughput_rps']:>9.2f}x "
+              f"{r['p50_ms'] / o['p50_ms']:>7.2f}x {r['p99_ms'] / o['p99_ms']:>7.2f}x")
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the clinical inference API against synthetic stand-in models")
+    ap.add_argument("--concurrency", type=str, default="1,4,16,64", help="comma-separated client counts")
+    ap.add_argument("--endpoints", type=str, default=",".join(ENDPOINTS))
+    ap.add_argument("--duration", type=float, default=10.0, help="measured seconds per (endpoint, concurrency)")
+    ap.add_argument("--warmup", type=float, default=2.0)
+    ap.add_argument("--workers", type=int, default=1, help="API worker processes (pre-fork)")
+    ap.add_argument("--env", action="append", default=[], help="extra KEY=VALUE for the API process, e.g. ML_MICROBATCH=1")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--label", type=str, default=None, help="suffix for the output file name")
+    ap.add_argument("--compare", type=str, default=None, help="earlier results JSON to compare against")
+    args = ap.parse_args()
+
+    extra_env = dict(kv.split("=", 1) for kv in args.env)
+    levels = [int(c) for c in args.concurrency.split(",") if c]
+    endpoints = [e for e in args.endpoints.split(",") if e]
+
+    with tempfile.TemporaryDirectory() as models_dir:
+        train_standin_models(models_dir, seed=args.seed)
+        proc, base = start_server(models_dir, free_port(), args.workers, extra_env)
+        try:
+            results = []
+            for endpoint in endpoints:
+                for c in levels:
+                    r = drive(base, endpoint, c, args.duration, args.warmup, args.seed)
+                    results.append(r)
+                    print(f"{endpoint:28} c={c:<4} {r['throughput_rps']:>9.1f} rps  "
+                          f"p50={r['p50_ms']}ms p95={r['p95_ms']}ms p99={r['p99_ms']}ms errors={r['errors']}")
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+    commit = git_commit()
+    out = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "workers": args.workers,
+            "env": extra_env,
+            "duration_s": args.duration,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    name = f"{TODAY}_{commit}" + (f"_{args.label}" if args.label else "") + "_bench.json"
+    (OUT / name).write_text(json.dumps(out, indent=2))
+    print(f"\nResults written to {OUT / name}")
+    if args.compare:
+        compare(out, args.compare)
+
+if __name__ == "__main__":
+    main()
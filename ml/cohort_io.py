@@ -0,0 +1,77 @@
+"""
+Chunked readers for population (cohort) scoring files.
+
+Reads CSV, NDJSON or Arrow IPC stream input from a binary file object one
+record at a time, so a 200k-row cohort is never held in memory as a whole.
+Used by the /predict/clinical_risk/stream endpoint and ml/score_cohort.py.
+"""
+
+import csv, json
+from typing import IO, Dict, Iterable, Iterator, List, Optional
+
+FORMATS = ("csv", "ndjson", "arrow")
+
+CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/vnd.apache.arrow.stream": "arrow",
+}
+
+EXTENSIONS = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson", ".arrow": "arrow", ".arrows": "arrow"}
+
+def detect_format(fmt: Optional[str] = None, content_type: Optional[str] = None, filename: Optional[str] = None) -> Optional[str]:
+    """Explicit format wins, then Content-Type, then file extension."""
+    if fmt:
+        return fmt.lower() if fmt.lower() in FORMATS else None
+    if content_type:
+        found = CONTENT_TYPES.get(content_type.split(";")[0].strip().lower())
+        if found:
+            return found
+    if filename:
+        for ext, found in EXTENSIONS.items():
+            if filename.lower().endswith(ext):
+                return found
+    return None
+
+def _clean(row: Dict) -> Dict:
+    # Blank cells mean "not provided", so the ClinicalInput defaults apply
+    return {k: v for k, v in row.items() if v is not None and v != ""}
+
+def iter_csv(f: IO[bytes]) -> Iterator[Dict]:
+    lines = (raw.decode("utf-8-sig") for raw in f)
+    for row in csv.DictReader(lines):
+        yield _clean(row)
+
+def iter_ndjson(f: IO[bytes]) -> Iterator[Dict]:
+    for raw in f:
+        raw = raw.strip()
+        if raw:
+            yield _clean(json.loads(raw))
+
+def iter_arrow(f: IO[bytes]) -> Iterator[Dict]:
+    try:
+        import pyarrow.ipc as ipc
+    except ImportError:
+        raise RuntimeError("Arrow input needs pyarrow (pip install pyarrow)")
+    reader = ipc.open_stream(f)
+    for batch in reader:
+        for row in batch.to_pylist():
+            yield _clean(row)
+
+READERS = {"csv": iter_csv, "ndjson": iter_ndjson, "arrow": iter_arrow}
+
+def iter_records(f: IO[bytes], fmt: str) -> Iterator[Dict]:
+    return READERS[fmt](f)
+
+def iter_chunks(records: Iterable[Dict], size: int) -> Iterator[List[Dict]]:
+    chunk: List[Dict] = []
+    for r in records:
+        chunk.append(r)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -1,3 +1,6 @@
+import json, random, time
+from typing import Iterator, List
+
 from supabase import create_client, Client
 from .config import SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY
 
@@ -5,3 +8,55 @@ def sb_client() -> Client:
     if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
         raise RuntimeError("Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY")
     return create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+
+# Upsert chunking: stay well under PostgREST / gateway request size limits
+UPSERT_MAX_ROWS = 500
+UPSERT_MAX_BYTES = 1_000_000
+
+# HTTP statuses and Postgres SQLSTATEs worth retrying (timeouts, overload, lock conflicts)
+TRANSIENT_CODES = {
+    "408", "425", "429", "500", "502", "503", "504",
+    "40001", "40P01", "53300", "57014",
+}
+
+def is_transient(e: Exception) -> bool:
+    try:
+        import httpx
+        if isinstance(e, (httpx.TransportError, httpx.TimeoutException)):
+            return True
+    except ImportError:
+        pass
+    code = getattr(e, "code", None) or getattr(getattr(e, "response", None), "status_code", None)
+    return str(code) in TRANSIENT_CODES
+
+def with_retry(fn, retries: int = 4, backoff_s: float = 0.5):
+    """Call fn(), retrying transient failures with jittered exponential backoff."""
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == retries or not is_transient(e):
+                raise
+            delay = backoff_s * (2 ** attempt) * (0.5 + random.random())
+            print(f"⚠️ Warning: transient write error, retrying in {delay:.1f}s ({attempt + 1}/{retries}). Error: {e}")
+            time.sleep(delay)
+
+def chunk_rows(rows: List[dict], max_rows: int = UPSERT_MAX_ROWS, max_bytes: int = UPSERT_MAX_BYTES) -> Iterator[List[dict]]:
+    """Split rows into chunks bounded by row count and (estimated) JSON size."""
+    if not rows:
+        return
+    # Rows from one writer share a shape; size a chunk from a sample, with headroom
+    sample = rows[:32]
+    per_row = max(1, sum(len(json.dumps(r)) for r in sample) // len(sample))
+    size = max(1, min(max_rows, int(max_bytes / (per_row * 1.25))))
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+def upsert_chunked(client, table: str, rows: List[dict], on_conflict: str,
+                   max_rows: int = UPSERT_MAX_ROWS, max_bytes: int = UPSERT_MAX_BYTES, retries: int = 4) -> int:
+    """Upsert rows in size-bounded chunks, retrying each chunk on transient failure."""
+    total = 0
+    for chunk in chunk_rows(rows, max_rows, max_bytes):
+        with_retry(lambda: client.table(table).upsert(chunk, on_conflict=on_conflict).execute(), retries=retries)
+        total += len(chunk)
+    return total
@@ -7,6 +7,7 @@ import os, numpy as np, pandas as pd, datetime as dt
 import shap, matplotlib.pyplot as plt
 from typing import Dict, List
 from ml.config import supabase, WEIGHTS_V1
+from ml.metrics_reader import fetch_user_ids, iter_user_frames
 
 OUT_DIR = os.path.join(os.path.dirname(__file__), "outputs")
 os.makedirs(OUT_DIR, exist_ok=True)
@@ -85,10 +86,8 @@ def proxy_y(Xz: np.ndarray):
     # HRV(z-) (invert), RHR(z+) (as-is), Sleep(z-) (invert), Steps(z-) (invert)
     return (-Xz[:,0] + Xz[:,1] - Xz[:,2] -Xz[:,3])
 
-def fetch_user_df(user_id: str) -> pd.DataFrame:
-    # Use the canonical view shaped for ML
-    res = supabase.table("metrics_for_ml").select("*").eq("user_id", user_id).order("day").execute()
-    df = pd.DataFrame(res.data or [])
+def prepare_user_df(df: pd.DataFrame) -> pd.DataFrame:
+    """Raw metrics_for_ml rows for one user (ordered by day) -> typed frame, or empty."""
     if df.empty:
         return df
     df["day"] = pd.to_datetime(df["day"]).dt.date
@@ -133,10 +132,14 @@ def fallback_linear_bar(df: pd.DataFrame, uid: str):
     upload_and_record_plot(uid, df, outfile)
 
 def main():
-    users = supabase.table("users").select("id").execute().data or []
-    for u in users:
-        uid = u["id"]
-        df = fetch_user_df(uid)
+    # One paginated scan of metrics_for_ml for all users instead of a query per user
+    users = set(fetch_user_ids(supabase))
+    seen = set()
+    for uid, raw in iter_user_frames(supabase):
+        if uid not in users:
+            continue
+        seen.add(uid)
+        df = prepare_user_df(raw)
         if df.empty:
             print(f"Skipping {uid}: no data.")
             continue
@@ -165,5 +168,8 @@ def main():
         print("Saved", outfile)
         upload_and_record_plot(uid, df, outfile)
 
+    for uid in users - seen:
+        print(f"Skipping {uid}: no data.")
+
 if __name__ == "__main__":
     main()
@@ -4,16 +4,35 @@ Simple GRU forecaster that predicts next-day 'risk proxy' from sequences of
 and store in risk_scores with model_version = forecast_v0.1.
 
 This is intentionally lightweight for MVP.
+
+Run:
+  python -m ml.forecast_model                       # one GRU per user
+  python -m ml.forecast_model --workers 8            # users spread over 8 processes
+  python -m ml.forecast_model --shared --embed-dim 8
+
+--shared trains one GRU for all users on mini-batches of their (per-user
+normalized) windows, optionally with a learned per-user embedding appended to
+every time step, then forecasts every user in one batched forward pass.
+
+Each model is checkpointed (ml/forecast_store.py; per user, or one cohort file
+for --shared). The next run resumes from the checkpoint and fine-tunes for
+--finetune-steps steps on only the days added since it was saved, and trains
+from scratch when there is none, it is older than --refit-days, or --refit is
+given.
 """
 
-import argparse, json
+import argparse, json, math
 import numpy as np
 import pandas as pd
 import torch
 import torch.nn as nn
 from datetime import date, timedelta
 from typing import List, Literal
-from ml.config import supabase, MODEL_VERSION_FORECAST
+from ml.config import supabase, MODEL_VERSION_FORECAST, SEED
+from ml.metrics_reader import fetch_user_ids, iter_user_frames
+from ml.db import UPSERT_MAX_ROWS, upsert_chunked
+from ml.parallel import imap_processes
+from ml.forecast_store import CHECKPOINT_DIR, CheckpointStore, cohort_key, user_key
 
 FEATURES = ["hrv_mean", "rhr_mean", "sleep_hours", "steps"]
 DEVICE = "cpu"
@@ -45,10 +64,23 @@ class GRURegressor(nn.Module):
         out, _ = self.gru(x)
         return self.head(out[:, -1, :])
 
-def fetch_user_days(user_id: str) -> pd.DataFrame:
-    # Read from the canonical view we created
-    res = supabase.table("metrics_for_ml").select("*").eq("user_id", user_id).order("day").execute()
-    df = pd.DataFrame(res.data or [])
+class SharedGRURegressor(nn.Module):
+    """GRURegressor shared across users; an optional user embedding is appended to each step."""
+    def __init__(self, input_dim=4, hidden=32, layers=1, n_users=0, embed_dim=0):
+        super().__init__()
+        self.embed = nn.Embedding(n_users, embed_dim) if n_users and embed_dim else None
+        extra = embed_dim if self.embed is not None else 0
+        self.gru = nn.GRU(input_dim + extra, hidden, num_layers=layers, batch_first=True)
+        self.head = nn.Linear(hidden, 1)
+    def forward(self, x, users=None):
+        if self.embed is not None:
+            e = self.embed(users).unsqueeze(1).expand(-1, x.shape[1], -1)
+            x = torch.cat([x, e], dim=2)
+        out, _ = self.gru(x)
+        return self.head(out[:, -1, :])
+
+def prepare_user_days(df: pd.DataFrame) -> pd.DataFrame:
+    """Raw metrics_for_ml rows for one user (ordered by day) -> typed frame, or empty."""
     if df.empty:
         return df
 
@@ -68,28 +100,77 @@ def fetch_user_days(user_id: str) -> pd.DataFrame:
     return df
 
 
-def train_and_predict(df: pd.DataFrame, seq_len=14):
-    if len(df) < (seq_len + 16):
-        return None  # not enough history to train and forecast robustly
-    # Normalize per-user
+def sliding_windows(x, seq_len: int) -> torch.Tensor:
+    """
+    (T, F) series -> (T-seq_len+1, seq_len, F) with window i = x[i:i+seq_len].
+
+    A strided view over the series' own storage (nothing is copied), which
+    nn.GRU accepts as is; index it to pick windows or a mini-batch.
+    """
+    if isinstance(x, np.ndarray):
+        x = torch.from_numpy(x)
+    return x.unfold(0, seq_len, 1).transpose(1, 2)
+
+FINETUNE_STEPS = 20  # optimizer steps on the new days when resuming from a checkpoint
+REFIT_DAYS = 28      # retrain from scratch once a checkpoint's fit is older than this
+
+def normalize_user(df: pd.DataFrame, mu=None, sd=None):
+    """
+    Per-user z-space features and next-day proxy target (proxy = -hrv + rhr - sleep - steps).
+    mu/sd default to this history's own; pass a checkpoint's to stay in its space.
+    """
     X = df[FEATURES].astype(float).values
-    mu, sd = np.nanmean(X, axis=0), np.nanstd(X, axis=0) + 1e-6
+    if mu is None:
+        mu, sd = np.nanmean(X, axis=0), np.nanstd(X, axis=0) + 1e-6
     Xn = (X - mu) / sd
+    proxy = -Xn[:,0] + Xn[:,1] - Xn[:,2] - Xn[:,3]
+    return Xn, proxy, mu, sd
+
+def fresh_targets(Xn: np.ndarray, proxy: np.ndarray, seq_len: int, first: int = 0) -> np.ndarray:
+    """Target rows j >= first whose window Xn[j-seq_len:j] and target are all finite."""
+    bad = np.concatenate(([0], np.cumsum(~np.isfinite(Xn).all(axis=1))))
+    j = np.arange(max(first, seq_len), len(Xn))
+    return j[(bad[j] - bad[j - seq_len] == 0) & np.isfinite(proxy[j])]
+
+def new_rows(df: pd.DataFrame, last_day: str) -> int:
+    """Index of the first row after a checkpoint's last_day (rows are ordered by day)."""
+    return int((df["day"] <= date.fromisoformat(last_day)).sum())
+
+def checkpoint_usable(checkpoint, last_day: date, seq_len: int, refit_days: int, **config) -> bool:
+    if not checkpoint or checkpoint.get("model_version") != MODEL_VERSION_FORECAST:
+        return False
+    if checkpoint.get("features") != FEATURES or checkpoint.get("seq_len") != seq_len:
+        return False
+    if any(checkpoint.get(k) != v for k, v in config.items()):
+        return False
+    return (last_day - date.fromisoformat(checkpoint["fit_day"])).days <= refit_days
+
+def finite_params(model: nn.Module) -> bool:
+    return all(bool(torch.isfinite(p).all()) for p in model.parameters())
+
+def to_risk(next_proxy) -> float:
+    # Map proxy to 0..1 risk with sigmoid
+    risk = 1 / (1 + np.exp(-1.0 * next_proxy))
+    # JSON-safe risk
+    if not np.isfinite(risk):
+        risk = 0.5
+    return float(risk)
+
+def fit_user(df: pd.DataFrame, seq_len=14):
+    """Train one user's GRU from scratch -> (risk, checkpoint), or (None, None) if history is too short."""
+    if len(df) < (seq_len + 16):
+        return None, None  # not enough history to train and forecast robustly
+    # Normalize per-user
+    Xn, proxy, mu, sd = normalize_user(df)
 
     # Build sequences and next-day target (proxy: weighted combo where worse direction is positive)
-    # proxy = -hrv + rhr - sleep - steps (z-space)
-    z = Xn
-    proxy = (-z[:,0] + z[:,1] - z[:,2] - z[:,3]).reshape(-1,1)
-
-    xs, ys = [], []
-    for i in range(len(Xn) - seq_len - 1):
-        xs.append(Xn[i:i+seq_len])
-        ys.append(proxy[i+seq_len])  # predict next day proxy
-    if len(xs) < 32:  # too little data
-        return None
+    n = len(Xn) - seq_len - 1
+    if n < 32:  # too little data
+        return None, None
 
-    xs = torch.tensor(np.stack(xs), dtype=torch.float32, device=DEVICE)
-    ys = torch.tensor(np.stack(ys), dtype=torch.float32, device=DEVICE)
+    series = torch.tensor(Xn, dtype=torch.float32, device=DEVICE)
+    xs = sliding_windows(series, seq_len)[:n]
+    ys = torch.tensor(proxy[seq_len:seq_len+n], dtype=torch.float32, device=DEVICE).unsqueeze(1)  # predict next day proxy
 
     model = GRURegressor(input_dim=Xn.shape[1]).to(DEVICE)
     opt = torch.optim.Adam(model.parameters(), lr=1e-3)
@@ -105,41 +186,275 @@ def train_and_predict(df: pd.DataFrame, seq_len=14):
 
     # Predict last sequence → next day proxy
     with torch.no_grad():
-        last_seq = torch.tensor(Xn[-seq_len:], dtype=torch.float32, device=DEVICE).unsqueeze(0)
+        last_seq = sliding_windows(series, seq_len)[-1:]
         next_proxy = model(last_seq).cpu().numpy().ravel()[0]
 
-    # Map proxy to 0..1 risk with sigmoid
-    risk = 1 / (1 + np.exp(-1.0 * next_proxy))
-    # JSON-safe risk
-    if not np.isfinite(risk):
-        risk = 0.5
-    return float(risk)
+    risk = to_risk(next_proxy)
+    if not finite_params(model):  # a NaN in the history poisoned the weights; don't persist them
+        return risk, None
+    last_day = df["day"].max().isoformat()
+    return risk, {
+        "model_version": MODEL_VERSION_FORECAST, "features": FEATURES, "seq_len": seq_len,
+        "hidden": model.gru.hidden_size, "mu": mu.tolist(), "sd": sd.tolist(),
+        "fit_day": last_day, "last_day": last_day,
+        "state": model.state_dict(), "optimizer": opt.state_dict(),
+    }
+
+def forecast_user(df: pd.DataFrame, seq_len=14, checkpoint=None,
+                  finetune_steps=FINETUNE_STEPS, refit_days=REFIT_DAYS):
+    """
+    Next-day risk for one user -> (risk or None, checkpoint to save or None).
+
+    With a usable checkpoint the GRU resumes from its weights and optimizer
+    state, keeps its mu/sd, and takes `finetune_steps` steps on only the
+    windows whose target day is newer than the checkpoint's last_day.
+    Otherwise (no checkpoint, a config change, or a fit older than
+    `refit_days`) it trains from scratch.
+    """
+    last_day = df["day"].max()
+    if not checkpoint_usable(checkpoint, last_day, seq_len, refit_days):
+        return fit_user(df, seq_len)
+    first = new_rows(df, checkpoint["last_day"])
+    Xn, proxy, _, _ = normalize_user(df, np.asarray(checkpoint["mu"]), np.asarray(checkpoint["sd"]))
+    series = torch.tensor(Xn, dtype=torch.float32, device=DEVICE)
+    windows = sliding_windows(series, seq_len)
+
+    model = GRURegressor(input_dim=Xn.shape[1], hidden=checkpoint["hidden"]).to(DEVICE)
+    model.load_state_dict(checkpoint["state"])
+    opt = torch.optim.Adam(model.parameters(), lr=1e-3)
+    opt.load_state_dict(checkpoint["optimizer"])
+
+    j = fresh_targets(Xn, proxy, seq_len, first)
+    if len(j):
+        xs = windows[torch.as_tensor(j - seq_len)]
+        ys = torch.tensor(proxy[j], dtype=torch.float32, device=DEVICE).unsqueeze(1)
+        loss_fn = nn.SmoothL1Loss()
+        model.train()
+        for _ in range(finetune_steps):
+            opt.zero_grad()
+            loss = loss_fn(model(xs), ys)
+            loss.backward()
+            opt.step()
+        if not finite_params(model):
+            return fit_user(df, seq_len)
+
+    with torch.no_grad():
+        risk = to_risk(model(windows[-1:]).cpu().numpy().ravel()[0])
+    if first >= len(df):
+        return risk, None  # nothing new since the checkpoint
+    return risk, {**checkpoint, "last_day": last_day.isoformat(),
+                  "state": model.state_dict(), "optimizer": opt.state_dict()}
+
+def _batches(n: int, batch_size: int, gen: torch.Generator):
+    while True:
+        yield from torch.randperm(n, generator=gen).split(batch_size)
 
-def upsert(user_id: str, next_day: date, risk: float, df: pd.DataFrame):
+def train_shared_and_predict(frames: dict, seq_len=14, embed_dim=0, epochs=5, batch_size=256, hidden=32,
+                             checkpoint=None, finetune_steps=FINETUNE_STEPS, refit_days=REFIT_DAYS):
+    """
+    One GRU for all users: {user_id: frame} -> ({user_id: next-day risk}, checkpoint or None).
+
+    Each user is normalized on their own history. Windows stay as (user, start)
+    index pairs into one sliding_windows view and are only gathered per
+    mini-batch. Missing feature values become 0 (the user's mean) on input,
+    and windows without a target are skipped, so one user's gaps can't poison
+    the shared weights.
+
+    With a usable checkpoint, training resumes from it for `finetune_steps`
+    mini-batches drawn from the days each user added since their last_day
+    (all days for users new to the cohort, who also get a fresh embedding
+    row); users keep their checkpointed mu/sd. Otherwise it trains `epochs`
+    passes from scratch. Only users that contributed training windows this run
+    are forecast; with none at all nothing is forecast or checkpointed.
+    """
+    last_day = max((df["day"].max() for df in frames.values() if len(df) >= seq_len), default=None)
+    if last_day is None:
+        return {}, None
+    resume = checkpoint_usable(checkpoint, last_day, seq_len, refit_days, hidden=hidden, embed_dim=embed_dim)
+    known = checkpoint["users"] if resume else {}
+    cohort = list(checkpoint["uids"]) if resume else []
+    slot = {uid: i for i, uid in enumerate(cohort)}
+
+    uids, series, offsets, starts, targets, users = [], [], [], [], [], {}
+    offset = 0
+    for uid, df in frames.items():
+        if len(df) < seq_len:
+            continue
+        if uid in known:
+            Xn, proxy, mu, sd = normalize_user(df, np.asarray(known[uid]["mu"]), np.asarray(known[uid]["sd"]))
+            first = new_rows(df, known[uid]["last_day"])
+        else:
+            Xn, proxy, mu, sd = normalize_user(df)
+            first = 0
+        Xn = np.nan_to_num(Xn, nan=0.0)
+        j = fresh_targets(Xn, proxy, seq_len, first)
+        if not len(j):
+            continue  # nothing to learn from this user this run, so no forecast either
+        if uid not in slot:
+            slot[uid] = len(cohort)
+            cohort.append(uid)
+        uids.append(uid)
+        series.append(Xn)
+        offsets.append(offset)
+        starts.extend((slot[uid], offset + k - seq_len) for k in j)
+        targets.extend(proxy[j])
+        users[uid] = {"mu": np.asarray(mu).tolist(), "sd": np.asarray(sd).tolist(),
+                      "last_day": df["day"].max().isoformat()}
+        offset += len(Xn)
+    if not starts:
+        return {}, None  # no training windows: an untrained model must not be forecast or saved
+
+    torch.manual_seed(SEED)
+    data = torch.tensor(np.concatenate(series), dtype=torch.float32, device=DEVICE)
+    windows = sliding_windows(data, seq_len)  # windows spanning two users are never indexed
+    model = SharedGRURegressor(input_dim=data.shape[1], hidden=hidden, n_users=len(cohort), embed_dim=embed_dim).to(DEVICE)
+    opt = torch.optim.Adam(model.parameters(), lr=1e-3)
+    if resume:
+        state = dict(checkpoint["state"])
+        grown = model.embed is not None and len(cohort) > len(checkpoint["uids"])
+        if grown:  # keep trained rows, new users start from the fresh init
+            rows = model.embed.weight.detach().clone()
+            rows[:len(checkpoint["uids"])] = state["embed.weight"]
+            state["embed.weight"] = rows
+        model.load_state_dict(state)
+        if not grown:  # Adam moments no longer match a grown embedding
+            opt.load_state_dict(checkpoint["optimizer"])
+
+    index = torch.tensor(starts, dtype=torch.long, device=DEVICE)
+    ys = torch.tensor(np.asarray(targets), dtype=torch.float32, device=DEVICE).unsqueeze(1)
+    loss_fn = nn.SmoothL1Loss()
+    gen = torch.Generator().manual_seed(SEED)
+    steps = finetune_steps if resume else epochs * math.ceil(len(index) / batch_size)
+    model.train()
+    for _, batch in zip(range(steps), _batches(len(index), batch_size, gen)):
+        emb, first = index[batch, 0], index[batch, 1]
+        xb = windows[first]  # only the mini-batch is materialized
+        opt.zero_grad()
+        loss = loss_fn(model(xb, emb), ys[batch])
+        loss.backward()
+        opt.step()
+    if resume and not finite_params(model):
+        return train_shared_and_predict(frames, seq_len, embed_dim, epochs, batch_size, hidden)
+
+    # Every user's last window in one forward pass
+    model.eval()
+    with torch.no_grad():
+        last = torch.tensor([o + len(x) - seq_len for o, x in zip(offsets, series)], dtype=torch.long, device=DEVICE)
+        emb = torch.tensor([slot[uid] for uid in uids], dtype=torch.long, device=DEVICE)
+        next_proxy = model(windows[last], emb).cpu().numpy().ravel()
+    risks = {uid: to_risk(p) for uid, p in zip(uids, next_proxy)}
+
+    if not finite_params(model):
+        return risks, None
+    return risks, {
+        "model_version": MODEL_VERSION_FORECAST, "features": FEATURES, "seq_len": seq_len,
+        "hidden": hidden, "embed_dim": embed_dim,
+        "fit_day": checkpoint["fit_day"] if resume else last_day.isoformat(),
+        "last_day": last_day.isoformat(), "uids": cohort, "users": {**known, **users},
+        "state": model.state_dict(), "optimizer": opt.state_dict(),
+    }
+
+def forecast_row(user_id: str, next_day: date, risk: float, df: pd.DataFrame) -> dict:
     feat = df[df["day"] == df["day"].max()][FEATURES].iloc[0].to_dict()
-    supabase.table("risk_scores").upsert({
+    return {
         "user_id": user_id,
         "day": next_day.isoformat(),
         "risk_score": risk,
         "model_version": MODEL_VERSION_FORECAST,
         "features": json.dumps({"last_observed": feat})
-    }, on_conflict="user_id,day,model_version").execute()
+    }
+
+def write_rows(rows: list) -> int:
+    return upsert_chunked(supabase, "risk_scores", rows, on_conflict="user_id,day,model_version")
+
+def _init_worker():
+    # Tiny GRUs lose to intra-op threading overhead; parallelism comes from processes
+    torch.set_num_threads(1)
+
+def _forecast_task(task: tuple):
+    """
+    Process-pool entry point -> risk row or None. Each user has its own
+    checkpoint file, so the worker loads and saves it itself and only the
+    (small, picklable) row travels back.
+    """
+    uid, raw, seq_len, checkpoint_dir, refit, finetune_steps, refit_days = task
+    df = prepare_user_days(raw)
+    if df.empty:
+        return None
+    store, key = CheckpointStore(checkpoint_dir), user_key(uid)
+    torch.manual_seed(SEED)  # per-user init, whichever process or position the user lands in
+    r, ckpt = forecast_user(df, seq_len=seq_len, checkpoint=None if refit else store.load(key),
+                            finetune_steps=finetune_steps, refit_days=refit_days)
+    if r is None:
+        return None
+    if ckpt is not None:
+        store.save(key, ckpt)
+    return forecast_row(uid, df["day"].max() + timedelta(days=1), r, df)
+
+def run_users(tasks, workers: int = 1, flush_rows: int = UPSERT_MAX_ROWS) -> int:
+    """
+    Forecast every task's user and upsert the rows in batches from this process.
+
+    With workers > 1 users are spread over that many spawned processes, each
+    limited to one torch thread, with at most 4 * workers users in flight.
+    Every user trains from the same seed, so results don't depend on the
+    worker count or on the order users arrive in.
+    """
+    total, rows = 0, []
+    for row in imap_processes(_forecast_task, tasks, workers, initializer=_init_worker):
+        if row is not None:
+            rows.append(row)
+        if len(rows) >= flush_rows:
+            total += write_rows(rows)
+            rows = []
+    if rows:
+        total += write_rows(rows)
+    return total
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--seq_len", type=int, default=14)
+    ap.add_argument("--shared", action="store_true", help="train one GRU for all users instead of one per user")
+    ap.add_argument("--embed-dim", type=int, default=0, help="per-user embedding size for --shared (0 = none)")
+    ap.add_argument("--epochs", type=int, default=5, help="passes over all users' windows for --shared")
+    ap.add_argument("--batch-size", type=int, default=256)
+    ap.add_argument("--checkpoint-dir", default=CHECKPOINT_DIR, help="where GRU checkpoints are kept")
+    ap.add_argument("--finetune-steps", type=int, default=FINETUNE_STEPS,
+                    help="steps on the new days when resuming from a checkpoint")
+    ap.add_argument("--refit-days", type=int, default=REFIT_DAYS,
+                    help="retrain from scratch once a checkpoint's fit is this many days old")
+    ap.add_argument("--refit", action="store_true", help="ignore existing checkpoints and retrain every model")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="training processes for the per-user models, one torch thread each (1 = serial)")
     args = ap.parse_args()
+    store = CheckpointStore(args.checkpoint_dir)
+
+    if args.shared:
+        users = set(fetch_user_ids(supabase))
+        frames = {}
+        for uid, raw in iter_user_frames(supabase):
+            if uid not in users: continue
+            df = prepare_user_days(raw)
+            if not df.empty:
+                frames[uid] = df
+        key = cohort_key("shared")
+        risks, ckpt = train_shared_and_predict(frames, seq_len=args.seq_len, embed_dim=args.embed_dim,
+                                               epochs=args.epochs, batch_size=args.batch_size,
+                                               checkpoint=None if args.refit else store.load(key),
+                                               finetune_steps=args.finetune_steps, refit_days=args.refit_days)
+        write_rows([forecast_row(uid, frames[uid]["day"].max() + timedelta(days=1), r, frames[uid])
+                    for uid, r in risks.items()])
+        if ckpt is not None:
+            store.save(key, ckpt)
+        print(f"Forecast risks upserted for {len(risks)} users (shared GRU).")
+        return
 
-    users = supabase.table("users").select("id").execute().data or []
-    for u in users:
-        uid = u["id"]
-        df = fetch_user_days(uid)
-        if df.empty: continue
-        r = train_and_predict(df, seq_len=args.seq_len)
-        if r is None: continue
-        next_day = df["day"].max() + timedelta(days=1)
-        upsert(uid, next_day, r, df)
-    print("Forecast risks upserted.")
+    # One paginated scan of metrics_for_ml for all users instead of a query per user
+    users = set(fetch_user_ids(supabase))
+    tasks = ((uid, raw, args.seq_len, args.checkpoint_dir, args.refit, args.finetune_steps, args.refit_days)
+             for uid, raw in iter_user_frames(supabase) if uid in users)
+    n = run_users(tasks, workers=args.workers)
+    print(f"Forecast risks upserted for {n} users.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,51 @@
+"""
+On-disk checkpoints for the forecast GRUs.
+
+One file per key ("user-<id>" for the per-user models, "cohort-<name>" for a
+shared model) holding the weights, optimizer state, normalization stats and
+the last day trained on, so the nightly forecast run can resume each model
+instead of training it from random init. Writes go to a temp file that is
+renamed into place, so a crashed run never leaves a truncated checkpoint.
+
+Files are loaded with weights_only=True: checkpoints are plain dicts of
+tensors, numbers, strings and lists.
+"""
+
+import os
+import re
+from typing import Optional
+
+import torch
+
+CHECKPOINT_DIR = os.getenv("ML_FORECAST_CHECKPOINTS",
+                           os.path.join(os.path.dirname(__file__), "models", "forecast"))
+
+def user_key(user_id: str) -> str:
+    return f"user-{user_id}"
+
+def cohort_key(name: str) -> str:
+    return f"cohort-{name}"
+
+class CheckpointStore:
+    def __init__(self, root: str = CHECKPOINT_DIR):
+        self.root = root
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, re.sub(r"[^A-Za-z0-9_.-]", "_", key) + ".pt")
+
+    def load(self, key: str) -> Optional[dict]:
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            return torch.load(path, map_location="cpu", weights_only=True)
+        except Exception as e:
+            print(f"⚠️ Warning: ignoring unreadable forecast checkpoint {path}: {e}")
+            return None
+
+    def save(self, key: str, checkpoint: dict):
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path(key)
+        tmp_path = path + ".tmp"
+        torch.save(checkpoint, tmp_path)
+        os.replace(tmp_path, path)
@@ -0,0 +1,74 @@
+"""
+Bounded executor for model inference.
+
+A fixed number of worker threads plus a fixed-size wait queue. Once both are
+full, run() raises PoolSaturated immediately instead of queueing, so the API
+can shed the excess with a 503 + Retry-After rather than letting latency grow
+without bound under a spike.
+"""
+
+import asyncio, contextvars, threading
+from concurrent.futures import ThreadPoolExecutor
+
+class PoolSaturated(Exception):
+    """Raised when every worker is busy and the wait queue is full."""
+
+class InferencePool:
+    def __init__(self, workers: int = 4, queue_size: int = 64):
+        self.workers = max(1, int(workers))
+        self.queue_size = max(0, int(queue_size))
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+        self._pending = 0  # running + waiting
+        self._running = 0
+        self.rejected = 0
+
+    def _try_reserve(self) -> bool:
+        with self._lock:
+            if self._pending >= self.workers + self.queue_size:
+                self.rejected += 1
+                return False
+            self._pending += 1
+            return True
+
+    def _call(self, ctx, fn, args):
+        with self._lock:
+            self._running += 1
+        try:
+            return ctx.run(fn, *args)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._pending -= 1
+
+    async def run(self, fn, *args):
+        """Run fn(*args) on a worker thread and await its result, or raise PoolSaturated."""
+        if not self._try_reserve():
+            raise PoolSaturated()
+        # Carry contextvars (request-scoped state) into the worker thread
+        ctx = contextvars.copy_context()
+        try:
+            fut = self._executor.submit(self._call, ctx, fn, args)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        fut.add_done_callback(self._release_if_cancelled)
+        return await asyncio.wrap_future(fut)
+
+    def _release_if_cancelled(self, fut):
+        # A caller that disconnects while still queued cancels the future before
+        # _call runs, so its slot has to be released here instead.
+        if fut.cancelled():
+            with self._lock:
+                self._pending -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "running": self._running,
+                "queue_depth": self._pending - self._running,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,78 @@
+"""
+Bulk reader for the metrics_for_ml view.
+
+Pages through the whole (optionally date-bounded) view in (user_id, day)
+order with keyset pagination: each page asks for rows strictly after the last
+(user_id, day) seen, so a page costs the same however deep into the table it
+is, and no page is cut short by PostgREST's max-rows cap without us noticing
+(we stop only on an empty page). Rows are regrouped into one DataFrame per
+user as soon as that user's last row has arrived.
+
+Replaces one query per user (and silently truncated long histories) in
+baseline_model, forecast_model and explainability.
+"""
+
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+VIEW = "metrics_for_ml"
+PAGE_SIZE = 1000  # keep <= the PostgREST max-rows setting (1000 on Supabase)
+
+def fetch_keyed(client, table: str, columns: str, key: str, eq: Optional[dict] = None,
+                page_size: int = PAGE_SIZE) -> List[dict]:
+    """Every row of `table` (filtered by equality on `eq`), paged by the unique column `key`."""
+    out, last = [], None
+    while True:
+        q = client.table(table).select(columns)
+        for col, value in (eq or {}).items():
+            q = q.eq(col, value)
+        if last is not None:
+            q = q.gt(key, last)
+        rows = q.order(key).limit(page_size).execute().data or []
+        if not rows:
+            return out
+        out.extend(rows)
+        last = rows[-1][key]
+
+def fetch_user_ids(client, page_size: int = PAGE_SIZE) -> List[str]:
+    """All ids in the users table, paged by id so large tables aren't capped either."""
+    return [r["id"] for r in fetch_keyed(client, "users", "id", "id", page_size=page_size)]
+
+def iter_metric_pages(client, columns: str = "*", since: Optional[str] = None, until: Optional[str] = None,
+                      user_ids: Optional[Iterable[str]] = None, page_size: int = PAGE_SIZE,
+                      day_column: str = "day") -> Iterator[List[dict]]:
+    """Yield pages of raw rows ordered by (user_id, day). `columns` must include user_id and the day column."""
+    user_ids = list(user_ids) if user_ids is not None else None
+    if user_ids is not None and not user_ids:
+        return
+    last = None
+    while True:
+        q = client.table(VIEW).select(columns)
+        if since: q = q.gte(day_column, since)
+        if until: q = q.lte(day_column, until)
+        if user_ids is not None: q = q.in_("user_id", user_ids)
+        if last is not None:
+            uid, day = last["user_id"], last[day_column]
+            q = q.or_(f"user_id.gt.{uid},and(user_id.eq.{uid},{day_column}.gt.{day})")
+        rows = q.order("user_id").order(day_column).limit(page_size).execute().data or []
+        if not rows:
+            return
+        yield rows
+        last = rows[-1]
+
+def iter_user_frames(client, columns: str = "*", since: Optional[str] = None, until: Optional[str] = None,
+                     user_ids: Optional[Iterable[str]] = None, page_size: int = PAGE_SIZE,
+                     day_column: str = "day") -> Iterator[Tuple[str, pd.DataFrame]]:
+    """Yield (user_id, rows ordered by day) per user, in user_id order."""
+    current, buf = None, []
+    for page in iter_metric_pages(client, columns, since, until, user_ids, page_size, day_column):
+        for row in page:
+            uid = row["user_id"]
+            if uid != current:
+                if buf:
+                    yield current, pd.DataFrame(buf)
+                current, buf = uid, []
+            buf.append(row)
+    if buf:
+        yield current, pd.DataFrame(buf)
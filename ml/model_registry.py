@@ -0,0 +1,221 @@
+"""
+Versioned model registry for the inference service.
+
+Picks the newest `<name>_model_vN.pkl` per model in the models directory
+(falling back to `<name>_model.pkl`), loads it with joblib, and publishes
+everything a request needs as one immutable ModelSnapshot. Artifacts are read
+onto the heap: sklearn's tree unpickling copies the node arrays anyway, so
+memory-mapping kept only ~1-2 KB per model mapped and bought nothing.
+
+A background thread polls the directory (including model_metadata.json) and
+swaps in a new snapshot once a changed set of files has been stable for one
+poll interval. The swap is a single reference assignment, so requests that
+already hold the previous snapshot finish on the models they started with.
+A reload that would serve fewer models than the current snapshot (an artifact
+that fails to load or is rejected by `prepare`) raises instead, leaving the
+previous snapshot in place and the reason in `last_error`.
+
+Candidate artifacts named in `shadow` are never promoted by discovery; they are
+loaded into a second snapshot hung off the primary one (snapshot.shadow) for
+shadow scoring.
+"""
+
+import json, os, re, threading, time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
+
+import joblib
+
+ARTIFACT_RE = re.compile(r"^(?P<name>[a-z]+)_model(?:_v(?P<version>\d+))?\.pkl$")
+METADATA_FILE = "model_metadata.json"
+
+class ModelSnapshot:
+    """Models plus everything derived from them, loaded together and never mutated."""
+    def __init__(self, models=None, templates=None, engines=None, versions=None, metadata=None, loaded_at=None,
+                 shadow=None, explainers=None):
+        self.models = models or {}
+        self.templates = templates or {}
+        self.engines = engines or {}
+        self.explainers = explainers or {}
+        self.versions = versions or {}
+        self.metadata = metadata or {}
+        self.loaded_at = loaded_at
+        self.shadow: Optional["ModelSnapshot"] = shadow
+
+    def has(self, *names: str) -> bool:
+        return all(n in self.models for n in names)
+
+class ModelRegistry:
+    def __init__(self, models_dir: str, names=("diabetes", "cardio"),
+                 prepare: Optional[Callable[[ModelSnapshot], None]] = None, poll_s: float = 5.0,
+                 shadow: Optional[Dict[str, str]] = None,
+                 prepare_shadow: Optional[Callable[[ModelSnapshot], None]] = None):
+        """
+        prepare: called on each freshly loaded snapshot before it is published,
+                 to fill in derived state (templates, compiled engines, ...).
+        prepare_shadow: the same for the shadow snapshot (defaults to prepare);
+                 shadow candidates are only scored, so they can skip the rest.
+        poll_s:  directory poll interval for hot reload; 0 disables watching.
+        shadow:  {model name: candidate artifact file} to load for shadow scoring.
+        """
+        self.models_dir = models_dir
+        self.names = tuple(names)
+        self.prepare = prepare
+        self.prepare_shadow = prepare_shadow or prepare
+        self.poll_s = poll_s
+        self.shadow = {n: f for n, f in (shadow or {}).items() if n in self.names}
+        self._snapshot = ModelSnapshot()
+        self._fingerprint = None
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self.reloads = 0
+        self.last_error = None
+
+    def current(self) -> ModelSnapshot:
+        return self._snapshot
+
+    def discover(self) -> Dict[str, dict]:
+        """Newest artifact per model name: {name: {"file", "path", "version"}}."""
+        found: Dict[str, dict] = {}
+        try:
+            files = os.listdir(self.models_dir)
+        except FileNotFoundError:
+            return found
+        for fname in files:
+            m = ARTIFACT_RE.match(fname)
+            if not m or m.group("name") not in self.names or fname in self.shadow.values():
+                continue
+            version = int(m.group("version")) if m.group("version") else 0
+            best = found.get(m.group("name"))
+            if best is None or version > best["version"]:
+                found[m.group("name")] = {
+                    "file": fname,
+                    "path": os.path.join(self.models_dir, fname),
+                    "version": version,
+                }
+        return found
+
+    def discover_shadow(self) -> Dict[str, dict]:
+        """Configured candidate artifacts that exist: {name: {"file", "path", "version"}}."""
+        found: Dict[str, dict] = {}
+        for name, fname in self.shadow.items():
+            path = os.path.join(self.models_dir, fname)
+            if not os.path.exists(path):
+                continue
+            m = ARTIFACT_RE.match(fname)
+            version = int(m.group("version")) if m and m.group("version") else 0
+            found[name] = {"file": fname, "path": path, "version": version}
+        return found
+
+    def _fingerprint_of(self, artifacts: Dict[str, dict]):
+        paths = [a["path"] for a in artifacts.values()] + [os.path.join(self.models_dir, METADATA_FILE)]
+        paths += [os.path.join(self.models_dir, f) for f in self.shadow.values()]
+        fp = []
+        for p in sorted(paths):
+            try:
+                st = os.stat(p)
+                fp.append((p, st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                fp.append((p, None, None))
+        return tuple(fp)
+
+    def _read_metadata(self) -> dict:
+        path = os.path.join(self.models_dir, METADATA_FILE)
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    def load(self) -> ModelSnapshot:
+        """Load the newest artifacts and publish them as the current snapshot."""
+        with self._reload_lock:
+            artifacts = self.discover()
+            fingerprint = self._fingerprint_of(artifacts)
+            missing = [n for n in self.names if n not in artifacts]
+            if missing:
+                print(f"⚠️ Warning: no artifact for {missing} in {self.models_dir}")
+
+            models, versions = {}, {}
+            for name, art in artifacts.items():
+                models[name] = joblib.load(art["path"])
+                versions[name] = {"file": art["file"], "version": art["version"]}
+
+            loaded_at = datetime.now(timezone.utc).isoformat()
+            snap = ModelSnapshot(
+                models=models,
+                versions=versions,
+                metadata=self._read_metadata(),
+                loaded_at=loaded_at,
+            )
+            if self.prepare is not None:
+                self.prepare(snap)
+            # prepare may reject a model (e.g. feature mismatch); a reload must never
+            # publish a snapshot that serves less than the one it replaces
+            lost = [n for n in self._snapshot.models if n not in snap.models]
+            if lost:
+                self.last_error = f"reload would drop {lost}; keeping previous models"
+                raise RuntimeError(self.last_error)
+            if self.shadow:
+                snap.shadow = self._load_shadow(loaded_at)
+            self._snapshot = snap  # single reference swap; in-flight requests keep the old one
+            self._fingerprint = fingerprint
+            self.reloads += 1
+            self.last_error = None
+            return snap
+
+    def _load_shadow(self, loaded_at: str) -> Optional[ModelSnapshot]:
+        candidates = self.discover_shadow()
+        missing = [f for n, f in self.shadow.items() if n not in candidates]
+        if missing:
+            print(f"⚠️ Warning: shadow artifact(s) {missing} not found in {self.models_dir}")
+        if not candidates:
+            return None
+        shadow = ModelSnapshot(
+            models={n: joblib.load(a["path"]) for n, a in candidates.items()},
+            versions={n: {"file": a["file"], "version": a["version"]} for n, a in candidates.items()},
+            loaded_at=loaded_at,
+        )
+        if self.prepare_shadow is not None:
+            self.prepare_shadow(shadow)
+        return shadow if shadow.models else None
+
+    def _watch(self):
+        pending = None
+        while True:
+            time.sleep(self.poll_s)
+            try:
+                fp = self._fingerprint_of(self.discover())
+                if fp == self._fingerprint:
+                    pending = None
+                    continue
+                if fp != pending:
+                    # Changed since last poll; wait until the files stop changing
+                    pending = fp
+                    continue
+                snap = self.load()
+                pending = None
+                print(f"🔄 Models reloaded: {snap.versions}")
+            except Exception as e:
+                self.last_error = str(e)
+                self._fingerprint = pending  # don't retry the same broken files every poll
+                pending = None
+                print(f"⚠️ Warning: model reload failed, keeping previous models. Error: {e}")
+
+    def start_watching(self):
+        """Start the hot-reload thread (once per process)."""
+        if self.poll_s <= 0 or (self._watcher is not None and self._watcher.is_alive()):
+            return
+        self._watcher = threading.Thread(target=self._watch, name="model-registry", daemon=True)
+        self._watcher.start()
+
+    def stats(self) -> dict:
+        snap = self._snapshot
+        return {
+            "models_dir": self.models_dir,
+            "versions": snap.versions,
+            "shadow_versions": snap.shadow.versions if snap.shadow is not None else {},
+            "loaded_at": snap.loaded_at,
+            "reloads": self.reloads,
+            "watching": self._watcher is not None and self._watcher.is_alive(),
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,40 @@
+"""
+Process fan-out shared by the batch scoring jobs (baseline_model, forecast_model).
+
+Tasks are submitted as the caller's iterator produces them (so a streaming
+reader is never drained ahead of the workers), with a bounded number in
+flight, and results come back in task order.
+"""
+
+import multiprocessing as mp
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, Optional
+
+def limit_native_threads():
+    # One BLAS/OpenMP thread per process, or N workers oversubscribe the box N-fold.
+    # Set before the pool spawns, so the workers inherit it.
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ.setdefault(var, "1")
+
+def imap_processes(fn: Callable, tasks: Iterable, workers: int, initializer: Optional[Callable] = None,
+                   per_worker: int = 4) -> Iterator:
+    """
+    fn(task) for each task across `workers` spawned processes, yielded in task
+    order with at most per_worker * workers tasks in flight. workers <= 1 runs
+    in this process.
+    """
+    if workers <= 1:
+        yield from map(fn, tasks)
+        return
+    limit_native_threads()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"),
+                             initializer=initializer) as pool:
+        in_flight = deque()
+        for task in tasks:
+            in_flight.append(pool.submit(fn, task))
+            if len(in_flight) >= per_worker * workers:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
@@ -0,0 +1,89 @@
+"""
+Pre-fork multi-process serving for the inference API.
+
+`uvicorn --workers N` spawns fresh interpreters, and each one re-imports the
+app and loads its own copy of every model, so memory grows linearly with the
+worker count. Here the parent imports the app (loading models and compiling
+the tree engines once), binds the listening socket, freezes the GC, and then
+forks N workers that all accept on the same socket. The read-only model
+arrays stay in pages shared copy-on-write with the parent.
+
+Threads (model watcher, micro-batcher, inference pool) are started lazily in
+each worker, never in the parent. A model hot-reloaded inside a worker is
+private to that worker until the service is restarted.
+
+POSIX only; elsewhere it falls back to a single uvicorn process.
+"""
+
+import gc, os, signal, socket, time
+import uvicorn
+
+def _bind(host: str, port: int) -> socket.socket:
+    # Explicit IPPROTO_TCP: asyncio only sets TCP_NODELAY on accepted sockets whose
+    # proto says TCP, and with proto 0 Nagle + delayed ACK stall keep-alive replies ~40 ms
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+def _run_worker(app, sock: socket.socket, log_level: str):
+    # Drop the parent's handlers; uvicorn installs its own for graceful shutdown
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    server = uvicorn.Server(uvicorn.Config(app, log_level=log_level))
+    server.run(sockets=[sock])
+
+def serve_prefork(app, host: str = "0.0.0.0", port: int = 8000, workers: int = 1, log_level: str = "info"):
+    if workers <= 1 or not hasattr(os, "fork"):
+        uvicorn.run(app, host=host, port=port, log_level=log_level)
+        return
+
+    sock = _bind(host, port)
+    # Everything loaded so far (models, compiled engines) moves to a permanent
+    # generation, so collections in the workers don't write to those pages.
+    gc.collect()
+    gc.freeze()
+
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _run_worker(app, sock, log_level)
+            finally:
+                os._exit(0)
+        children.add(pid)
+
+    for _ in range(workers):
+        spawn()
+    print(f"🚀 Serving on http://{host}:{port} with {workers} pre-forked workers (parent pid {os.getpid()})")
+
+    def shutdown(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            print(f"⚠️ Worker {pid} exited with status {status}; restarting")
+            time.sleep(0.5)
+            spawn()
+    sock.close()
@@ -0,0 +1,87 @@
+"""
+Score a population (cohort) file with the clinical models.
+
+Streams a CSV, NDJSON or Arrow IPC stream file to the inference service's
+/predict/clinical_risk/stream endpoint and writes the NDJSON results as they
+arrive. With --local it scores in-process with the same code path instead of
+going over HTTP. Either way the input is read in chunks, never all at once.
+
+Run:
+  python -m ml.score_cohort cohort.csv --out scores.ndjson
+  python -m ml.score_cohort cohort.arrow --url http://scoring-box:8000 --chunk-size 5000
+  python -m ml.score_cohort cohort.ndjson --local --out scores.ndjson
+"""
+
+import argparse, os, sys, time
+import requests
+
+try:
+    from .cohort_io import detect_format
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from ml.cohort_io import detect_format
+
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson", "arrow": "application/vnd.apache.arrow.stream"}
+
+def score_remote(path: str, fmt: str, url: str, chunk_size: int, out):
+    with open(path, "rb") as f:
+        resp = requests.post(
+            f"{url.rstrip('/')}/predict/clinical_risk/stream",
+            params={"format": fmt, "chunk_size": chunk_size},
+            headers={"Content-Type": MEDIA_TYPES[fmt]},
+            data=f,
+            stream=True,
+            timeout=(10, None),
+        )
+        resp.raise_for_status()
+        for line in resp.iter_lines():
+            if line:
+                out.write(line.decode("utf-8") + "\n")
+                yield line
+
+def score_local(path: str, fmt: str, chunk_size: int, out):
+    try:
+        from ml.api import score_stream, REGISTRY
+    except ImportError:
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        from ml.api import score_stream, REGISTRY
+    if not REGISTRY.current().has("diabetes", "cardio"):
+        raise RuntimeError("Models not loaded; train them first with python -m ml.train_model")
+    with open(path, "rb") as f:
+        for block in score_stream(f, fmt, chunk_size):
+            out.write(block)
+            for line in block.splitlines():
+                yield line
+
+def main():
+    ap = argparse.ArgumentParser(description="Score a cohort file (CSV / NDJSON / Arrow) with the clinical models")
+    ap.add_argument("path", type=str)
+    ap.add_argument("--out", type=str, default="-", help="NDJSON output path (default: stdout)")
+    ap.add_argument("--format", type=str, default=None, choices=["csv", "ndjson", "arrow"],
+                    help="input format (default: from file extension)")
+    ap.add_argument("--url", type=str, default=os.getenv("ML_API_URL", "http://localhost:8000"))
+    ap.add_argument("--local", action="store_true", help="score in-process instead of calling the API")
+    ap.add_argument("--chunk-size", type=int, default=1000)
+    args = ap.parse_args()
+
+    fmt = detect_format(args.format, filename=args.path)
+    if fmt is None:
+        ap.error("could not infer the input format; pass --format")
+
+    out = sys.stdout if args.out == "-" else open(args.out, "w")
+    t0 = time.time()
+    n = 0
+    try:
+        lines = (score_local(args.path, fmt, args.chunk_size, out) if args.local
+                 else score_remote(args.path, fmt, args.url, args.chunk_size, out))
+        for _ in lines:
+            n += 1
+            if n % 10000 == 0:
+                print(f"[score_cohort] {n} rows in {time.time() - t0:.1f}s", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"[score_cohort] done: {n} rows in {time.time() - t0:.1f}s", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Shadow scoring of candidate models.
+
+A sample of live requests is handed to one background thread after the
+primary result has been computed; the thread rebuilds the features with the
+candidate's own template, scores them with the candidate model, and logs both
+outputs plus the latency difference as one JSON line per record. The request
+never waits on it: the hand-off queue is bounded and work is dropped (and
+counted) when the candidate can't keep up.
+"""
+
+import json, logging, queue, random, threading, time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional, Tuple
+
+shadow_log = logging.getLogger("subhealthai.shadow")
+
+def parse_candidates(spec: str) -> Dict[str, str]:
+    """"diabetes=diabetes_model_v2.pkl,cardio=cardio_model_v4.pkl" -> {name: file}."""
+    out = {}
+    for part in (spec or "").split(","):
+        if "=" in part:
+            name, fname = part.split("=", 1)
+            out[name.strip()] = fname.strip()
+    return out
+
+def configure_log(path: Optional[str] = None):
+    """JSON lines go to `path` if given, else stderr."""
+    if shadow_log.handlers:
+        return
+    handler = logging.FileHandler(path) if path else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    shadow_log.addHandler(handler)
+    shadow_log.setLevel(logging.INFO)
+    shadow_log.propagate = False
+
+class ShadowScorer:
+    def __init__(self, predict: Callable, sample_rate: float = 0.1, queue_size: int = 256):
+        """
+        predict: (snapshot, model name, X) -> positive-class probabilities.
+        sample_rate: fraction of scoring calls mirrored to the candidates.
+        """
+        self.predict = predict
+        self.sample_rate = max(0.0, min(1.0, sample_rate))
+        self._queue: "queue.Queue[tuple]" = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.dropped = 0
+        self.scored = 0
+        self.failed = 0
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="shadow-scorer", daemon=True)
+                    self._thread.start()
+
+    def offer(self, snap, jobs: Dict[str, Tuple[str, list, object, float]]):
+        """
+        Maybe mirror one scoring call. Never blocks.
+
+        jobs: {model name: (template key, records, primary probabilities, primary model seconds)}
+        """
+        shadow = getattr(snap, "shadow", None)
+        if shadow is None or not shadow.models or random.random() >= self.sample_rate:
+            return
+        jobs = {name: job for name, job in jobs.items() if name in shadow.models}
+        if not jobs:
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((snap, jobs))
+            with self._lock:
+                self.submitted += 1
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _run(self):
+        while True:
+            snap, jobs = self._queue.get()
+            for name, (template_key, records, primary_probs, primary_s) in jobs.items():
+                try:
+                    self._score(snap, name, template_key, records, primary_probs, primary_s)
+                    with self._lock:
+                        self.scored += 1
+                except Exception as e:
+                    with self._lock:
+                        self.failed += 1
+                    shadow_log.info(json.dumps({"event": "shadow_error", "model": name, "error": str(e)}))
+
+    def _score(self, snap, name, template_key, records, primary_probs, primary_s):
+        shadow = snap.shadow
+        X = shadow.templates[template_key].build(records)
+        t0 = time.perf_counter()
+        shadow_probs = self.predict(shadow, name, X)
+        shadow_s = time.perf_counter() - t0
+        ts = datetime.now(timezone.utc).isoformat()
+        for p, s in zip(primary_probs, shadow_probs):
+            shadow_log.info(json.dumps({
+                "event": "shadow",
+                "ts": ts,
+                "model": name,
+                "features": template_key,
+                "primary_version": snap.versions.get(name),
+                "shadow_version": shadow.versions.get(name),
+                "primary_prob": round(float(p), 6),
+                "shadow_prob": round(float(s), 6),
+                "abs_diff": round(abs(float(p) - float(s)), 6),
+                "batch_size": len(records),
+                "primary_ms": round(primary_s * 1000.0, 3),
+                "shadow_ms": round(shadow_s * 1000.0, 3),
+                "latency_delta_ms": round((shadow_s - primary_s) * 1000.0, 3),
+            }))
+
+    def stats(self) -> dict:
+        return {
+            "sample_rate": self.sample_rate,
+            "queued": self._queue.qsize(),
+            "submitted": self.submitted,
+            "dropped": self.dropped,
+            "scored": self.scored,
+            "failed": self.failed,
+        }
@@ -0,0 +1,127 @@
+"""
+Sliding-window quantiles that match np.quantile(window, q) exactly.
+
+For position i the window is the last up to w values including i, as in
+baseline_model.adaptive_threshold. Two engines:
+
+- SlidingQuantile / rolling_quantile: one series, kept as a sorted window.
+  Each step is a bisect insert plus a bisect delete (O(log w) search; the
+  shift is a C memmove), instead of re-sorting the window with np.quantile.
+- rolling_quantile_batch: many series at once. Series are NaN-padded into one
+  matrix, each chunk of rows is expanded into (rows, len, w) window views,
+  sorted along the window axis and interpolated in bulk.
+
+Both use numpy's "linear" method (virtual index (m-1)*q and the same
+two-sided lerp), so results are bit-for-bit what np.quantile returns. A window
+containing NaN yields NaN, as np.quantile does.
+"""
+
+import math
+from bisect import bisect_left, insort
+from collections import deque
+from typing import Iterable, List, Sequence
+
+import numpy as np
+
+def _lerp(a: float, b: float, t: float) -> float:
+    # numpy's _lerp: approach from whichever end is closer, for monotonicity
+    diff = b - a
+    if t >= 0.5:
+        return b - diff * (1 - t)
+    return a + diff * t
+
+class SlidingQuantile:
+    """q-quantile of the last `w` pushed values."""
+    def __init__(self, q: float, w: int):
+        if not 0.0 <= q <= 1.0:
+            raise ValueError("q must be in [0, 1]")
+        if w < 1:
+            raise ValueError("w must be >= 1")
+        self.q = q
+        self.w = w
+        self._order = deque()  # arrival order
+        self._sorted: List[float] = []  # finite values, ascending
+        self._nans = 0
+
+    def push(self, x: float) -> float:
+        x = float(x)
+        self._order.append(x)
+        if math.isnan(x):
+            self._nans += 1
+        else:
+            insort(self._sorted, x)
+        if len(self._order) > self.w:
+            old = self._order.popleft()
+            if math.isnan(old):
+                self._nans -= 1
+            else:
+                del self._sorted[bisect_left(self._sorted, old)]
+        return self.value()
+
+    def value(self) -> float:
+        if self._nans or not self._order:
+            return float("nan")
+        s = self._sorted
+        m = len(s)
+        v = (m - 1) * self.q
+        lo = math.floor(v)
+        if v >= m - 1:
+            return s[-1]
+        lo = max(lo, 0)
+        return _lerp(s[lo], s[lo + 1], v - lo)
+
+def rolling_quantile(xs: Iterable[float], q: float = 0.7, w: int = 28) -> List[float]:
+    window = SlidingQuantile(q, w)
+    return [window.push(x) for x in xs]
+
+# Bytes of (rows, len, w) window buffer allowed per chunk in the batch engine
+BATCH_BUDGET_BYTES = 64 * 1024 * 1024
+
+def rolling_quantile_batch(series: Sequence[Sequence[float]], q: float = 0.7, w: int = 28,
+                           budget_bytes: int = BATCH_BUDGET_BYTES) -> List[np.ndarray]:
+    """rolling_quantile for each series (any lengths), vectorized across series."""
+    if not 0.0 <= q <= 1.0:
+        raise ValueError("q must be in [0, 1]")
+    if w < 1:
+        raise ValueError("w must be >= 1")
+    arrays = [np.asarray(s, dtype=np.float64) for s in series]
+    if not arrays:
+        return []
+    n = max(len(a) for a in arrays)
+    if n == 0:
+        return [a.copy() for a in arrays]
+
+    # Window size per position: min(i + 1, w), and numpy's interpolation terms for it
+    m = np.minimum(np.arange(1, n + 1), w)
+    v = (m - 1) * q
+    lo = np.floor(v)
+    t = v - lo
+    lo = np.clip(lo.astype(np.intp), 0, m - 1)
+    hi = np.minimum(lo + 1, m - 1)
+    upper = t >= 0.5
+
+    out = [np.empty(len(a)) for a in arrays]
+    rows_per_chunk = max(1, budget_bytes // (n * w * 8))
+    for start in range(0, len(arrays), rows_per_chunk):
+        chunk = arrays[start:start + rows_per_chunk]
+        # Left-pad with w-1 inf so early windows are short: inf sorts after every
+        # real value, and positions >= m are never read
+        X = np.full((len(chunk), n + w - 1), np.inf)
+        has_nan = np.zeros((len(chunk), n), dtype=bool)
+        for r, a in enumerate(chunk):
+            X[r, w - 1:w - 1 + len(a)] = a
+            if len(a):
+                nan = np.isnan(a).astype(np.int64)
+                c = np.concatenate(([0], np.cumsum(nan)))
+                idx = np.arange(len(a))
+                has_nan[r, :len(a)] = (c[idx + 1] - c[np.maximum(idx + 1 - w, 0)]) > 0
+        windows = np.sort(np.lib.stride_tricks.sliding_window_view(X, w, axis=1), axis=2)
+        a_lo = np.take_along_axis(windows, lo[None, :, None], axis=2)[..., 0]
+        b_hi = np.take_along_axis(windows, hi[None, :, None], axis=2)[..., 0]
+        with np.errstate(invalid="ignore"):  # inf - inf in padding and NaN windows
+            diff = b_hi - a_lo
+            res = np.where(upper, b_hi - diff * (1 - t), a_lo + diff * t)
+        res[has_nan] = np.nan
+        for r, a in enumerate(chunk):
+            out[start + r][:] = res[r, :len(a)]
+    return out
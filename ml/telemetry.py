@@ -0,0 +1,249 @@
+"""
+In-process request telemetry for the inference API.
+
+An ASGI middleware opens a RequestTrace per request and keeps it in a
+contextvar, so code anywhere below it (including worker threads, which get a
+copy of the context) can attribute time to a named phase:
+
+    with phase("diabetes"):
+        ...
+
+Per endpoint we keep request/error counts, an in-flight gauge and latency
+histograms for the total and for each phase. Phases:
+  parse       request start -> handler entry (body read + pydantic parse)
+  features    feature-row assembly
+  diabetes    diabetes model evaluation
+  cardio      cardio model evaluation
+  batch_wait  waiting on the micro-batcher (coalescing window + batched models)
+  drivers     acute modifier and driver rules
+  explain     TreeSHAP attributions (/explain only)
+  handler     rest of the handler (thread hand-off, queueing)
+  serialize   handler exit -> response sent
+
+Optionally the same breakdown goes out as a Server-Timing header on traced
+endpoints and as one JSON log line per request.
+
+Numbers are per process; under pre-fork serving each worker reports its own.
+"""
+
+import json, logging, threading, time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Dict, Optional
+
+DEFAULT_BUCKETS_MS = (0.25, 0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+class Histogram:
+    """Fixed-bucket latency histogram (milliseconds)."""
+    def __init__(self, buckets=DEFAULT_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last bucket is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, ms: float):
+        i = 0
+        while i < len(self.buckets) and ms > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th observation."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 3) if self.count else None,
+            "p50_ms": self.quantile(0.50),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "max_ms": round(self.max, 3),
+            "buckets_ms": {
+                **{f"le_{b}": c for b, c in zip(self.buckets, self.counts)},
+                "le_inf": self.counts[-1],
+            },
+        }
+
+class RequestTrace:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases: Dict[str, float] = {}  # seconds
+        self.entered: Optional[float] = None
+        self.exited: Optional[float] = None
+
+    def add(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+_current: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current.get()
+
+@contextmanager
+def phase(name: str):
+    """Attribute the enclosed block's wall time to `name` on the current request, if any."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, time.perf_counter() - t0)
+
+def traced(fn: Callable):
+    """Mark handler entry/exit on an async endpoint so parse and serialize time can be split out."""
+    @wraps(fn)
+    async def wrapper(*args, **kwargs):
+        trace = _current.get()
+        if trace is not None:
+            trace.entered = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            if trace is not None:
+                trace.exited = time.perf_counter()
+    return wrapper
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.latency = Histogram()
+        self.phases: Dict[str, Histogram] = {}
+
+class Telemetry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints: Dict[str, EndpointStats] = {}
+
+    def _stats(self, key: str) -> EndpointStats:
+        stats = self.endpoints.get(key)
+        if stats is None:
+            stats = self.endpoints[key] = EndpointStats()
+        return stats
+
+    def begin(self, key: str):
+        with self._lock:
+            self._stats(key).in_flight += 1
+
+    def end(self, key: str, trace: RequestTrace, status: int, done: float):
+        phases = breakdown(trace, done)
+        with self._lock:
+            stats = self._stats(key)
+            stats.in_flight -= 1
+            stats.requests += 1
+            if status >= 500:
+                stats.errors += 1
+            stats.latency.observe((done - trace.start) * 1000.0)
+            for name, seconds in phases.items():
+                hist = stats.phases.get(name)
+                if hist is None:
+                    hist = stats.phases[name] = Histogram()
+                hist.observe(seconds * 1000.0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                key: {
+                    "requests": s.requests,
+                    "errors": s.errors,
+                    "in_flight": s.in_flight,
+                    "latency": s.latency.snapshot(),
+                    "phases": {name: h.snapshot() for name, h in s.phases.items()},
+                }
+                for key, s in self.endpoints.items()
+            }
+
+def breakdown(trace: RequestTrace, done: float) -> Dict[str, float]:
+    """Split a finished request into parse / handler / serialize plus recorded phases (seconds)."""
+    out = {}
+    if trace.entered is not None:
+        out["parse"] = trace.entered - trace.start
+    out.update(trace.phases)
+    if trace.entered is not None and trace.exited is not None:
+        recorded = sum(trace.phases.values())
+        out["handler"] = max(0.0, (trace.exited - trace.entered) - recorded)
+        out["serialize"] = max(0.0, done - trace.exited)
+    return out
+
+def server_timing(phases: Dict[str, float], total: float) -> str:
+    """Format phases (seconds) as a Server-Timing header value (milliseconds)."""
+    parts = [f"{name};dur={seconds * 1000.0:.3f}" for name, seconds in phases.items()]
+    parts.append(f"total;dur={total * 1000.0:.3f}")
+    return ", ".join(parts)
+
+timing_log = logging.getLogger("subhealthai.timing")
+if not timing_log.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    timing_log.addHandler(_handler)
+    timing_log.setLevel(logging.INFO)
+    timing_log.propagate = False
+
+class TelemetryMiddleware:
+    """
+    Pure ASGI middleware (no BaseHTTPMiddleware overhead) feeding a Telemetry instance.
+
+    server_timing: add a Server-Timing header to responses from traced endpoints.
+    log_timing:    emit one JSON line per traced request on the subhealthai.timing logger.
+    """
+    def __init__(self, app, telemetry: Telemetry, label: Callable[[str], str] = lambda path: path,
+                 server_timing: bool = False, log_timing: bool = False):
+        self.app = app
+        self.telemetry = telemetry
+        self.label = label
+        self.server_timing = server_timing
+        self.log_timing = log_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        key = f'{scope["method"]} {self.label(scope["path"])}'
+        trace = RequestTrace()
+        token = _current.set(trace)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if self.server_timing and trace.entered is not None:
+                    now = time.perf_counter()
+                    value = server_timing(breakdown(trace, now), now - trace.start)
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", value.encode())]
+            await send(message)
+
+        self.telemetry.begin(key)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            done = time.perf_counter()
+            self.telemetry.end(key, trace, status["code"], done)
+            _current.reset(token)
+            if self.log_timing and trace.entered is not None:
+                timing_log.info(json.dumps({
+                    "event": "request_timing",
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status["code"],
+                    "total_ms": round((done - trace.start) * 1000.0, 3),
+                    "phases_ms": {k: round(v * 1000.0, 3) for k, v in breakdown(trace, done).items()},
+                }))
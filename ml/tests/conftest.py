@@ -0,0 +1,44 @@
+"""
+Shared setup for the ml tests. Run from the repo root:
+  python -m pytest ml/tests -q
+
+ml.api loads models at import time, so point it at an empty directory with the
+watcher and explainers off before any test imports it. ml.config builds a
+Supabase client on import; the placeholder credentials below are never used to
+connect, since tests exercise the pure training/scoring functions only.
+"""
+
+import os
+import tempfile
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+os.environ.setdefault("ML_MODELS_DIR", tempfile.mkdtemp(prefix="ml-tests-models-"))
+os.environ.setdefault("ML_MODEL_POLL_S", "0")
+os.environ.setdefault("ML_EXPLAINERS", "0")
+os.environ.setdefault("NEXT_PUBLIC_SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "test.service.role")
+
+def fit_standin(model, columns, seed=0, n=200):
+    """Fit `model` on random data with named columns, like the shipped artifacts."""
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.normal(size=(n, len(columns))), columns=columns)
+    y = (X.iloc[:, 0] + rng.normal(scale=0.5, size=n) > 0).astype(int)
+    return model.fit(X, y)
+
+@pytest.fixture
+def registry(tmp_path):
+    """A ModelRegistry over v1 diabetes (GBM) and cardio (RF) stand-ins, loaded with the API's prepare step."""
+    from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+    from ml.api import CARDIO_COLUMNS, DIABETES_COLUMNS, prepare_snapshot
+    from ml.model_registry import ModelRegistry
+    joblib.dump(fit_standin(GradientBoostingClassifier(n_estimators=10, random_state=0), DIABETES_COLUMNS),
+                tmp_path / "diabetes_model_v1.pkl")
+    joblib.dump(fit_standin(RandomForestClassifier(n_estimators=10, random_state=0), CARDIO_COLUMNS),
+                tmp_path / "cardio_model_v1.pkl")
+    reg = ModelRegistry(str(tmp_path), prepare=prepare_snapshot, poll_s=0)
+    reg.load()
+    return reg, tmp_path
@@ -0,0 +1,29 @@
+import json
+
+import pytest
+from pydantic import ValidationError
+
+from ml.api import ClinicalInput, score_record_chunk
+
+ROW = {"glucose": 120, "bmi": 28.0, "age": 50, "systolic_bp": 130, "cholesterol": 210}
+
+@pytest.mark.parametrize("bad", ["nan", "inf", "-inf", float("nan"), float("inf")])
+def test_clinical_input_rejects_non_finite(bad):
+    with pytest.raises(ValidationError):
+        ClinicalInput.model_validate({**ROW, "glucose": bad})
+
+def test_stream_chunk_marks_non_finite_row_invalid_and_scores_the_rest(registry):
+    reg, _ = registry
+    # As the CSV reader hands them over: strings, one cell reading "nan"
+    rows = [{k: str(v) for k, v in ROW.items()} for _ in range(3)]
+    rows[1]["bmi"] = "nan"
+    lines = [json.loads(l) for l in score_record_chunk(rows, 10, reg.current()).splitlines()]
+    assert [l["row"] for l in lines] == [10, 11, 12]
+    assert lines[1]["status"] == "invalid" and "bmi" in lines[1]["error"]
+    assert lines[0]["status"] == lines[2]["status"] == "processed"
+    assert 0.0 <= lines[0]["analysis"]["diabetes_risk_percent"] <= 100.0
+
+def test_whatif_axis_rejects_non_finite_values():
+    from ml.api import SweepAxis
+    with pytest.raises(ValidationError):
+        SweepAxis(feature="glucose", values=[100.0, float("nan")])
@@ -0,0 +1,80 @@
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("supabase")
+
+from ml.baseline_model import _score_frame_incremental, incremental_frames, is_pending
+
+START = dt.date(2025, 1, 1)
+
+def _raw(n, seed=0, uid="u1"):
+    """metrics_for_ml rows as PostgREST returns them."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "user_id": uid,
+        "day": [(START + dt.timedelta(days=i)).isoformat() for i in range(n)],
+        "hrv_mean": rng.normal(50, 5, n),
+        "rhr_mean": rng.normal(60, 3, n),
+        "sleep_hours": rng.normal(7, 1, n),
+        "steps": rng.normal(8000, 1000, n),
+    })
+
+def _days(rows):
+    return [dt.date.fromisoformat(r["day"]) for r in rows]
+
+def test_bootstrap_scores_full_history_and_writes_state():
+    rows, state = _score_frame_incremental(("u1", _raw(40), None, None, 60))
+    assert len(rows) == 40
+    assert state["last_day"] == (START + dt.timedelta(days=39)).isoformat()
+    assert state["n_days"] == 40 and not is_pending(state)
+
+def test_bootstrap_skips_days_already_written():
+    hwm = START + dt.timedelta(days=29)
+    rows, state = _score_frame_incremental(("u1", _raw(40), None, hwm, 60))
+    assert min(_days(rows)) > hwm and len(rows) == 10
+    assert state["n_days"] == 40
+
+def test_new_days_score_only_past_the_mark():
+    _, state = _score_frame_incremental(("u1", _raw(40), None, None, 60))
+    rows, new_state = _score_frame_incremental(("u1", _raw(45), state, None, 60))
+    assert _days(rows) == [START + dt.timedelta(days=i) for i in range(40, 45)]
+    assert new_state["last_day"] == (START + dt.timedelta(days=44)).isoformat()
+    assert new_state["n_days"] == 45
+
+def test_no_new_days_writes_nothing():
+    raw = _raw(40)
+    _, state = _score_frame_incremental(("u1", raw, None, None, 60))
+    assert _score_frame_incremental(("u1", raw, state, None, 60)) == ([], None)
+
+def test_short_history_gets_pending_state():
+    rows, state = _score_frame_incremental(("u1", _raw(3), None, None, 60))
+    assert rows == [] and is_pending(state)
+    assert state["last_day"] == (START + dt.timedelta(days=2)).isoformat()
+
+def test_pending_users_are_only_refetched_with_new_rows(monkeypatch):
+    import ml.baseline_model as bm
+    data = {"quiet": _raw(3, uid="quiet"), "grown": _raw(8, uid="grown")}
+    mark = (START + dt.timedelta(days=2)).isoformat()
+    states = [{"user_id": u, "last_day": mark, "n_days": 3, "stats": {}} for u in data]
+    reads = []
+
+    def frames(client, columns="*", since=None, until=None, user_ids=None, day_column="day", **kw):
+        reads.append((since, tuple(user_ids)))
+        for uid in sorted(user_ids):
+            df = data[uid]
+            df = df[df["day"] >= since] if since else df
+            if len(df):
+                yield uid, df.reset_index(drop=True)
+
+    monkeypatch.setattr(bm, "fetch_users", lambda: list(data))
+    monkeypatch.setattr(bm, "resolve_metrics_columns", lambda: {})
+    monkeypatch.setattr(bm, "fetch_keyed", lambda *a, **k: states)
+    monkeypatch.setattr(bm, "iter_user_frames", frames)
+    monkeypatch.setattr(bm, "score_high_water", lambda uid: None)
+
+    out = list(incremental_frames(None, 60))
+    assert [(uid, len(raw), state) for uid, raw, state, _, _ in out] == [("grown", 8, None)]
+    assert reads == [((START + dt.timedelta(days=3)).isoformat(), ("grown", "quiet")), (None, ("grown",))]
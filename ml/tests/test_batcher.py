@@ -0,0 +1,36 @@
+import threading
+
+import pytest
+
+from ml.batcher import MicroBatcher
+
+def _score(items):
+    if any(x < 0 for x in items):
+        raise ValueError("negative input")
+    return [x * 2 for x in items]
+
+def test_failing_item_only_fails_its_own_caller():
+    gate = threading.Event()
+    calls = []
+
+    def score(items):
+        gate.wait(5)
+        calls.append(list(items))
+        return _score(items)
+
+    batcher = MicroBatcher(score, window_ms=50, max_batch=3)
+    futures = [batcher.submit(x) for x in (1, -1, 3)]
+    gate.set()
+    assert futures[0].result(5) == 2
+    assert futures[2].result(5) == 6
+    with pytest.raises(ValueError):
+        futures[1].result(5)
+    assert calls[0] == [1, -1, 3]  # coalesced first, then rescored one by one
+    assert batcher.stats()["fallbacks"] == 1
+
+def test_single_item_error_is_passed_through():
+    batcher = MicroBatcher(_score, window_ms=0)
+    with pytest.raises(ValueError):
+        batcher.score(-5, timeout=5)
+    assert batcher.score(4, timeout=5) == 8
+    assert batcher.stats()["fallbacks"] == 0
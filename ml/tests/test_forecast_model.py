@@ -0,0 +1,37 @@
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("supabase")
+
+from ml.forecast_model import train_shared_and_predict
+
+def _frame(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "day": [dt.date(2025, 1, 1) + dt.timedelta(days=i) for i in range(n)],
+        "hrv_mean": rng.normal(50, 5, n),
+        "rhr_mean": rng.normal(60, 3, n),
+        "sleep_hours": rng.normal(7, 1, n),
+        "steps": rng.normal(8000, 1000, n),
+    })
+
+def test_shared_without_training_windows_forecasts_and_saves_nothing():
+    # Exactly seq_len days: a last window to forecast from, but no target to train on
+    frames = {"a": _frame(14, 0), "b": _frame(14, 1)}
+    assert train_shared_and_predict(frames, seq_len=14) == ({}, None)
+
+def test_shared_forecasts_only_users_with_training_windows():
+    frames = {"long": _frame(40, 0), "short": _frame(14, 1)}
+    risks, checkpoint = train_shared_and_predict(frames, seq_len=14, epochs=1)
+    assert set(risks) == {"long"}
+    assert 0.0 <= risks["long"] <= 1.0
+    assert checkpoint["uids"] == ["long"]
+
+def test_shared_resume_with_no_new_days_saves_nothing():
+    frames = {"a": _frame(40, 0)}
+    _, checkpoint = train_shared_and_predict(frames, seq_len=14, epochs=1)
+    assert train_shared_and_predict(frames, seq_len=14, checkpoint=checkpoint) == ({}, None)
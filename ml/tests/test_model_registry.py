@@ -0,0 +1,50 @@
+import os
+
+import joblib
+import pytest
+from sklearn.ensemble import GradientBoostingClassifier
+
+from conftest import fit_standin
+
+def test_reload_that_drops_a_model_keeps_previous_snapshot(registry):
+    from ml.api import DIABETES_COLUMNS
+    reg, models_dir = registry
+    before = reg.current()
+    assert before.has("diabetes", "cardio")
+
+    # Newer artifact with the wrong feature set: prepare_snapshot rejects it
+    joblib.dump(fit_standin(GradientBoostingClassifier(n_estimators=10, random_state=0), DIABETES_COLUMNS[:6]),
+                os.path.join(models_dir, "diabetes_model_v2.pkl"))
+    with pytest.raises(RuntimeError):
+        reg.load()
+
+    assert reg.current() is before
+    assert reg.current().versions["diabetes"]["version"] == 1
+    assert "diabetes" in reg.last_error
+
+def test_good_reload_replaces_snapshot(registry):
+    from ml.api import DIABETES_COLUMNS
+    reg, models_dir = registry
+    joblib.dump(fit_standin(GradientBoostingClassifier(n_estimators=10, random_state=1), DIABETES_COLUMNS),
+                os.path.join(models_dir, "diabetes_model_v2.pkl"))
+    snap = reg.load()
+    assert reg.current() is snap
+    assert snap.versions["diabetes"]["version"] == 2
+    assert reg.last_error is None
+
+def test_shadow_snapshot_skips_explainers(registry, monkeypatch):
+    from ml import api
+    from ml.api import DIABETES_COLUMNS
+    from ml.model_registry import ModelRegistry
+    _, models_dir = registry
+    joblib.dump(fit_standin(GradientBoostingClassifier(n_estimators=10, random_state=2), DIABETES_COLUMNS),
+                os.path.join(models_dir, "diabetes_model_v9.pkl"))
+    explained = []
+    monkeypatch.setenv("ML_EXPLAINERS", "1")
+    monkeypatch.setattr(api, "build_explainers", lambda snap: explained.append(snap))
+    reg = ModelRegistry(str(models_dir), prepare=api.prepare_snapshot, poll_s=0,
+                        shadow={"diabetes": "diabetes_model_v9.pkl"},
+                        prepare_shadow=api.prepare_shadow_snapshot)
+    snap = reg.load()
+    assert snap.shadow is not None and "diabetes" in snap.shadow.engines
+    assert explained == [snap]
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+
+from ml.model_registry import ModelSnapshot
+from ml.tree_engine import PARITY_ATOL, compile_ensemble, parity_error, probe_rows
+
+def _data(seed, n=400, d=6):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(n, d))
+    y = (X[:, 0] + 0.5 * X[:, 1] - X[:, 2] + rng.normal(scale=0.5, size=n) > 0).astype(int)
+    return X, y
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("make", [
+    lambda s: GradientBoostingClassifier(n_estimators=50, max_depth=3, random_state=s),
+    lambda s: RandomForestClassifier(n_estimators=30, max_depth=6, random_state=s),
+], ids=["gbm", "forest"])
+def test_compiled_engine_matches_sklearn(make, seed):
+    X, y = _data(seed)
+    model = make(seed).fit(X, y)
+    engine = compile_ensemble(model)
+    assert engine is not None
+    assert parity_error(model, engine, probe_rows(engine, n=1024, seed=seed)) <= PARITY_ATOL
+    assert parity_error(model, engine, X) <= PARITY_ATOL
+
+class _Recorder:
+    """predict_proba stand-in that records who was asked."""
+    def __init__(self, label, calls):
+        self.label, self.calls = label, calls
+    def predict_proba(self, X):
+        self.calls.append(self.label)
+        return np.tile([0.25, 0.75], (len(X), 1))
+
+@pytest.fixture
+def routed_snapshot():
+    calls = []
+    snap = ModelSnapshot(models={"diabetes": _Recorder("sklearn", calls)},
+                         engines={"diabetes": _Recorder("engine", calls)})
+    return snap, calls
+
+def test_small_finite_inputs_use_engine(routed_snapshot):
+    from ml.api import predict_positive
+    snap, calls = routed_snapshot
+    predict_positive(snap, "diabetes", np.zeros((4, 8)))
+    assert calls == ["engine"]
+
+def test_nan_rows_fall_back_to_sklearn(routed_snapshot):
+    from ml.api import predict_positive
+    snap, calls = routed_snapshot
+    X = np.zeros((4, 8))
+    X[2, 3] = np.nan
+    predict_positive(snap, "diabetes", X)
+    assert calls == ["sklearn"]
+
+def test_large_inputs_fall_back_to_sklearn(routed_snapshot):
+    from ml.api import ENGINE_MAX_ROWS, predict_positive
+    snap, calls = routed_snapshot
+    predict_positive(snap, "diabetes", np.zeros((ENGINE_MAX_ROWS + 1, 8)))
+    predict_positive(snap, "diabetes", np.zeros((ENGINE_MAX_ROWS, 8)))
+    assert calls == ["sklearn", "engine"]
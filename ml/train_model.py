@@ -25,6 +25,13 @@ import io
 model_dir = os.path.join(os.path.dirname(__file__), 'models')
 os.makedirs(model_dir, exist_ok=True)
 
+def dump_atomic(obj, path):
+    """Write to a temp file and rename, so the API's hot reload never picks up a
+    half-written pickle."""
+    tmp_path = path + '.tmp'
+    joblib.dump(obj, tmp_path)
+    os.replace(tmp_path, path)
+
 print("🏥 SubHealthAI: Initializing Clinical Model Training Pipeline...")
 
 # ==========================================
@@ -74,8 +81,8 @@ try:
     # Save model (both v1 and default name for backward compatibility)
     diabetes_model_path_v1 = os.path.join(model_dir, 'diabetes_model_v1.pkl')
     diabetes_model_path = os.path.join(model_dir, 'diabetes_model.pkl')
-    joblib.dump(diabetes_model, diabetes_model_path_v1)
-    joblib.dump(diabetes_model, diabetes_model_path)  # For backward compatibility
+    dump_atomic(diabetes_model, diabetes_model_path_v1)
+    dump_atomic(diabetes_model, diabetes_model_path)  # For backward compatibility
     print(f"   💾 Model saved to: {diabetes_model_path_v1}")
 
 except Exception as e:
@@ -123,8 +130,8 @@ try:
     # Save model (both v1 and default name for backward compatibility)
     cardio_model_path_v1 = os.path.join(model_dir, 'cardio_model_v1.pkl')
     cardio_model_path = os.path.join(model_dir, 'cardio_model.pkl')
-    joblib.dump(heart_model, cardio_model_path_v1)
-    joblib.dump(heart_model, cardio_model_path)  # For backward compatibility
+    dump_atomic(heart_model, cardio_model_path_v1)
+    dump_atomic(heart_model, cardio_model_path)  # For backward compatibility
     print(f"   💾 Model saved to: {cardio_model_path_v1}")
 
 except Exception as e:
@@ -161,8 +168,9 @@ if heart_model is not None and heart_acc is not None:
 
 if meta:
     metadata_path = os.path.join(model_dir, 'model_metadata.json')
-    with open(metadata_path, "w") as f:
+    with open(metadata_path + ".tmp", "w") as f:
         json.dump(meta, f, indent=2)
+    os.replace(metadata_path + ".tmp", metadata_path)
     print(f"\n📄 Metadata written to: {metadata_path}")
 
 print("\n🚀 All Systems Operational. Models ready for inference.")
@@ -0,0 +1,163 @@
+"""
+Array-based evaluator for the clinical tree ensembles.
+
+Flattens a fitted GradientBoostingClassifier (diabetes) or
+RandomForestClassifier (cardio) into contiguous NumPy node arrays
+(feature index, threshold, left/right child, leaf value) and walks every tree
+for every row at once. For single rows this avoids sklearn's per-call input
+validation and joblib dispatch, which cost far more than walking ~100 shallow
+trees.
+
+Only binary classifiers are supported; anything else makes compile_ensemble()
+return None so callers keep using sklearn.
+
+Parity check against sklearn on the saved models:
+  python -m ml.tree_engine
+"""
+
+import os, sys
+import numpy as np
+
+PARITY_ATOL = 1e-9
+
+class CompiledEnsemble:
+    """
+    Flat node arrays for a whole ensemble.
+
+    Leaves loop back to themselves, so every row can take exactly `depth`
+    steps regardless of where its path ends. Thresholds are compared against
+    float32 inputs, the same way sklearn's Cython trees do.
+    """
+    def __init__(self, kind, feature, threshold, left, right, value, roots, depth, n_features, bias=0.0):
+        self.kind = kind  # "gbm" (log-odds sum) or "forest" (mean leaf proba)
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.depth = depth
+        self.n_features = n_features
+        self.bias = bias
+
+    def leaf_values(self, X) -> np.ndarray:
+        """Return the (n_rows, n_trees) leaf values each row lands in."""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        flat = X.ravel()
+        offsets = (np.arange(X.shape[0]) * self.n_features)[:, None]
+        node = np.broadcast_to(self.roots, (X.shape[0], len(self.roots)))
+        for _ in range(self.depth):
+            go_left = flat[offsets + self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+        return self.value[node]
+
+    def predict_proba(self, X) -> np.ndarray:
+        """Drop-in for the estimator's predict_proba: (n_rows, 2) class probabilities."""
+        leaves = self.leaf_values(X)
+        if self.kind == "gbm":
+            raw = self.bias + leaves.sum(axis=1)
+            p1 = 1.0 / (1.0 + np.exp(-raw))
+        else:
+            p1 = leaves.sum(axis=1) / leaves.shape[1]
+        return np.column_stack([1.0 - p1, p1])
+
+def _flatten(trees, leaf_value_fn):
+    feature, threshold, left, right, value, roots = [], [], [], [], [], []
+    offset, depth = 0, 0
+    for tree in trees:
+        t = tree.tree_
+        n = t.node_count
+        idx = np.arange(n, dtype=np.intp) + offset
+        is_leaf = t.children_left == -1
+        feature.append(np.where(is_leaf, 0, t.feature).astype(np.intp))
+        threshold.append(np.where(is_leaf, np.inf, t.threshold).astype(np.float64))
+        left.append(np.where(is_leaf, idx, t.children_left + offset).astype(np.intp))
+        right.append(np.where(is_leaf, idx, t.children_right + offset).astype(np.intp))
+        value.append(leaf_value_fn(t))
+        roots.append(offset)
+        offset += n
+        depth = max(depth, t.max_depth)
+    return (np.concatenate(feature), np.concatenate(threshold), np.concatenate(left),
+            np.concatenate(right), np.concatenate(value), np.asarray(roots, dtype=np.intp), depth)
+
+def _compile_gbm(model):
+    from sklearn.dummy import DummyClassifier
+    if getattr(model, "n_classes_", None) != 2 or model.loss not in ("log_loss", "deviance"):
+        return None
+    if not (model.init_ == "zero" or isinstance(model.init_, DummyClassifier)):
+        return None  # non-constant init estimator; raw score would depend on X
+    lr = model.learning_rate
+    arrays = _flatten(model.estimators_[:, 0], lambda t: lr * t.value[:, 0, 0])
+    engine = CompiledEnsemble("gbm", *arrays[:-1], depth=arrays[-1], n_features=model.n_features_in_)
+    # The init estimator is constant, so its log-odds is whatever decision_function
+    # adds on top of the trees for any row.
+    x0 = np.zeros((1, model.n_features_in_))
+    engine.bias = float(model.decision_function(x0).ravel()[0] - engine.leaf_values(x0).sum())
+    return engine
+
+def _compile_forest(model):
+    if getattr(model, "n_outputs_", 1) != 1 or getattr(model, "n_classes_", None) != 2:
+        return None
+
+    def leaf_proba(t):
+        v = t.value[:, 0, :]
+        total = v.sum(axis=1)
+        total[total == 0] = 1.0
+        return v[:, 1] / total
+
+    arrays = _flatten(model.estimators_, leaf_proba)
+    return CompiledEnsemble("forest", *arrays[:-1], depth=arrays[-1], n_features=model.n_features_in_)
+
+def compile_ensemble(model):
+    """Compile a fitted binary GBM or random forest; None if unsupported."""
+    from sklearn.ensemble import (GradientBoostingClassifier, RandomForestClassifier,
+                                  ExtraTreesClassifier)
+    if isinstance(model, GradientBoostingClassifier):
+        return _compile_gbm(model)
+    if isinstance(model, (RandomForestClassifier, ExtraTreesClassifier)):
+        return _compile_forest(model)
+    return None
+
+def probe_rows(engine: CompiledEnsemble, n: int = 256, seed: int = 0) -> np.ndarray:
+    """Random rows drawn around the ensemble's split thresholds so both branches get exercised."""
+    rng = np.random.default_rng(seed)
+    X = np.zeros((n, engine.n_features))
+    splits = np.isfinite(engine.threshold)
+    for j in range(engine.n_features):
+        ts = engine.threshold[splits & (engine.feature == j)]
+        if len(ts) == 0:
+            continue
+        picks = rng.choice(ts, size=n)
+        X[:, j] = picks + rng.choice([-1e-3, 0.0, 1e-3], size=n)
+    return X
+
+def parity_error(model, engine: CompiledEnsemble, X: np.ndarray) -> float:
+    """Max absolute difference between sklearn's and the engine's positive-class probability."""
+    return float(np.max(np.abs(model.predict_proba(X)[:, 1] - engine.predict_proba(X)[:, 1])))
+
+def main():
+    import joblib
+    models_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+    failed = False
+    for name in ["diabetes", "cardio"]:
+        path = os.path.join(models_dir, f"{name}_model_v1.pkl")
+        if not os.path.exists(path):
+            path = os.path.join(models_dir, f"{name}_model.pkl")
+        if not os.path.exists(path):
+            print(f"[parity] {name}: no model at {models_dir}")
+            continue
+        model = joblib.load(path)
+        engine = compile_ensemble(model)
+        if engine is None:
+            print(f"[parity] {name}: {type(model).__name__} not supported")
+            continue
+        err = parity_error(model, engine, probe_rows(engine, n=2048))
+        ok = err <= PARITY_ATOL
+        failed |= not ok
+        print(f"[parity] {name}: max |diff| = {err:.3e} ({'ok' if ok else 'FAIL'})")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+-- Incremental baseline scoring (python -m ml.baseline_model --incremental)
+-- Per-user robust baseline state, so nightly runs only fetch and score new days.
+CREATE TABLE IF NOT EXISTS public.baseline_state (
+  user_id uuid NOT NULL,
+  model_version text NOT NULL,
+  last_day date NOT NULL,            -- newest day folded into stats
+  n_days integer NOT NULL DEFAULT 0, -- days folded into stats so far
+  stats jsonb NOT NULL DEFAULT '{}'::jsonb, -- {feature: {median, mad, n}}; '{}' = too little history yet
+  updated_at timestamptz NOT NULL DEFAULT now(),
+  PRIMARY KEY (user_id, model_version)
+);
+
+-- Written by the scoring job with the service role only
+ALTER TABLE public.baseline_state ENABLE ROW LEVEL SECURITY;
+
@@ -0,0 +1,5 @@
+-- Incremental baseline scoring reads each user's high-water mark from
+-- baseline_state.last_day; users being bootstrapped look up their newest
+-- risk_scores day with an index-backed limit-1 read.
+CREATE INDEX IF NOT EXISTS risk_scores_user_version_day_idx
+  ON public.risk_scores (user_id, model_version, day DESC);